@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_line_color'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synchronizedtables',
+            name='last_full_sync',
+            field=models.DateTimeField(default=None, null=True, verbose_name='last full sync'),
+        ),
+        migrations.AddField(
+            model_name='synchronizedtables',
+            name='watermark',
+            field=models.CharField(default=None, max_length=255, null=True, verbose_name='watermark'),
+        ),
+    ]
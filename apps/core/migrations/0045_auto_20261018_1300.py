@@ -0,0 +1,28 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0044_auto_20261018_1100'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synchronizedtables',
+            name='changed_rows',
+            field=models.BigIntegerField(default=None, null=True, verbose_name='changed rows'),
+        ),
+        migrations.AddField(
+            model_name='synchronizedtables',
+            name='next_sync',
+            field=models.DateTimeField(default=None, null=True, verbose_name='next sync'),
+        ),
+        migrations.AddField(
+            model_name='synchronizedtables',
+            name='sync_interval',
+            field=models.IntegerField(default=None, null=True, verbose_name='sync interval (seconds)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_auto_20261018_1300'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synchronizedtables',
+            name='storage',
+            field=models.CharField(choices=[('table', 'Tabla'), ('materialized_view', 'Vista materializada')], default='table', max_length=20, verbose_name='storage'),
+        ),
+        migrations.AddField(
+            model_name='synchronizedtables',
+            name='unique_fields',
+            field=models.JSONField(default=list, verbose_name='unique fields'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0046_auto_20261018_1500'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synchronizedtables',
+            name='incremental',
+            field=models.BooleanField(default=False, verbose_name='incremental'),
+        ),
+    ]
@@ -81,6 +81,14 @@ def get_table_repeat_number(table_name: str):
 
 
 class SynchronizedTables(ModelBase):
+    TABLE = 'table'
+    MATERIALIZED_VIEW = 'materialized_view'
+
+    STORAGES = (
+        (TABLE, _('Tabla')),
+        (MATERIALIZED_VIEW, _('Vista materializada')),
+    )
+
     table_origin = models.CharField(max_length=100, verbose_name=_('table_origin'), default=None, null=True)
     table = models.CharField(max_length=100, verbose_name=_('table'))
     alias = models.CharField(max_length=255, verbose_name=_('alias'))
@@ -104,6 +112,14 @@ class SynchronizedTables(ModelBase):
         related_name=_('tables'),
         verbose_name=_('tables')
     )
+    watermark = models.CharField(max_length=255, verbose_name=_('watermark'), default=None, null=True)
+    last_full_sync = models.DateTimeField(verbose_name=_('last full sync'), default=None, null=True)
+    changed_rows = models.BigIntegerField(verbose_name=_('changed rows'), default=None, null=True)
+    sync_interval = models.IntegerField(verbose_name=_('sync interval (seconds)'), default=None, null=True)
+    next_sync = models.DateTimeField(verbose_name=_('next sync'), default=None, null=True)
+    storage = models.CharField(max_length=20, choices=STORAGES, default=TABLE, verbose_name=_('storage'))
+    unique_fields = models.JSONField(verbose_name=_('unique fields'), default=list)
+    incremental = models.BooleanField(verbose_name=_('incremental'), default=False)
 
     class Meta:
         verbose_name = _('synchronized table')
@@ -244,17 +260,22 @@ class Line(ModelBase):
 
 
 def post_save_synchronized_table(sender, instance: SynchronizedTables, **kwargs):
-    from ibartionmap.utils.functions import create_table_virtual
+    from ibartionmap.utils.functions import create_table_virtual, rebuild_virtual_tables, \
+        get_dependent_virtual_tables
     if instance.is_virtual:
         create_table_virtual(instance)
+        if instance.storage == SynchronizedTables.MATERIALIZED_VIEW:
+            # Recreating the view drops the materialized views built on top of it
+            rebuild_virtual_tables(get_dependent_virtual_tables([instance.id]))
 
 
 def post_delete_synchronized_table(sender, instance: SynchronizedTables, **kwargs):
+    from ibartionmap.utils.functions import drop_relation
     connection_on_map = connect_with_on_map()
     try:
         cursor_on_map = connection_on_map.cursor()
-        sql = "DROP TABLE IF EXISTS {0}".format(instance.table)
-        cursor_on_map.execute(sql)
+        drop_relation(cursor_on_map, instance.table)
+        cursor_on_map.execute("DROP TABLE IF EXISTS {0}__hash".format(instance.table))
         connection_on_map.commit()
     except Exception:
         pass
@@ -122,6 +122,13 @@ class SynchronizedTablesDefaultSerializer(DynamicFieldsMixin, serializers.ModelS
             raise serializers.ValidationError(detail={
                 'error': "Debe seleccionar al menos un campo"
             })
+        unique_fields = attrs.get('unique_fields', [])
+        if unique_fields:
+            aliases = [field.get('alias') for field in fields]
+            if [field for field in unique_fields if field not in aliases]:
+                raise serializers.ValidationError(detail={
+                    'error': "Los campos únicos deben ser alias de los campos de la tabla"
+                })
         if attrs.get('is_virtual', False):
             fields_set = set()
             fields_duplicates = [x for x in fields if
@@ -201,7 +208,8 @@ class SynchronizedTablesDefaultSerializer(DynamicFieldsMixin, serializers.ModelS
         model = SynchronizedTables
         fields = ('id', 'table_origin', 'table', 'alias', 'fields', 'connection_id', 'is_active', 'relations_table',
                   'is_virtual', 'markers', 'details', 'relations', 'relations_table', 'relations_display', 'sql',
-                  'tables', 'tables_display',)
+                  'tables', 'tables_display', 'storage', 'unique_fields',
+                  'incremental',)
 
 
 class LineDefaultSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0012_alter_connection_database_password'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='batch_size',
+            field=models.IntegerField(default=5000, verbose_name='batch size'),
+        ),
+    ]
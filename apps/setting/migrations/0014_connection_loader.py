@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0013_connection_batch_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='loader',
+            field=models.CharField(choices=[('COPY', 'COPY'), ('INSERT', 'INSERT')], default='COPY', max_length=10, verbose_name='loader'),
+        ),
+    ]
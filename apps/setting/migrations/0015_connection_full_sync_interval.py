@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0014_connection_loader'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='full_sync_interval',
+            field=models.IntegerField(default=0, verbose_name='full sync interval (hours)'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.8 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0015_connection_full_sync_interval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCheckpoint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='updated')),
+                ('run_id', models.UUIDField(verbose_name='run id')),
+                ('table_origin', models.CharField(max_length=255, verbose_name='table origin')),
+                ('last_key', models.CharField(default=None, max_length=255, null=True, verbose_name='last key')),
+                ('rows', models.BigIntegerField(default=0, verbose_name='rows')),
+                ('is_completed', models.BooleanField(default=False, verbose_name='is completed')),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='setting.connection', verbose_name='connection')),
+            ],
+            options={
+                'verbose_name': 'sync checkpoint',
+                'verbose_name_plural': 'sync checkpoints',
+                'unique_together': {('connection', 'table_origin')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.8 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0016_synccheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='adaptive_interval',
+            field=models.BooleanField(default=False, verbose_name='adaptive interval'),
+        ),
+        migrations.AddField(
+            model_name='connection',
+            name='max_interval',
+            field=models.IntegerField(default=3600, verbose_name='max interval (seconds)'),
+        ),
+        migrations.AddField(
+            model_name='connection',
+            name='min_interval',
+            field=models.IntegerField(default=10, verbose_name='min interval (seconds)'),
+        ),
+    ]
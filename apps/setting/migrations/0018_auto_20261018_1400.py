@@ -0,0 +1,33 @@
+# Generated by Django 3.2.8 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0017_auto_20261018_1300'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='batch_pause',
+            field=models.IntegerField(default=0, verbose_name='pause between batches (ms)'),
+        ),
+        migrations.AddField(
+            model_name='connection',
+            name='max_bytes_per_second',
+            field=models.IntegerField(default=0, verbose_name='max bytes per second'),
+        ),
+        migrations.AddField(
+            model_name='connection',
+            name='max_rows_per_second',
+            field=models.IntegerField(default=0, verbose_name='max rows per second'),
+        ),
+        migrations.AddField(
+            model_name='connection',
+            name='max_source_connections',
+            field=models.IntegerField(default=0, verbose_name='max source connections per host'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.8 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0018_auto_20261018_1400'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='binlog_file',
+            field=models.CharField(default=None, max_length=255, null=True, verbose_name='binlog file'),
+        ),
+        migrations.AddField(
+            model_name='connection',
+            name='binlog_position',
+            field=models.BigIntegerField(default=None, null=True, verbose_name='binlog position'),
+        ),
+        migrations.AlterField(
+            model_name='connection',
+            name='type',
+            field=models.SmallIntegerField(choices=[(0, 'Base de Datos'), (2, 'Binlog de MySQL')], default=0, verbose_name='type'),
+        ),
+    ]
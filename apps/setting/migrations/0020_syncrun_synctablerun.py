@@ -0,0 +1,64 @@
+# Generated by Django 3.2.8 on 2026-10-18 17:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0019_auto_20261018_1600'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='updated')),
+                ('task_id', models.CharField(default=None, max_length=255, null=True, verbose_name='task id')),
+                ('full', models.BooleanField(default=False, verbose_name='full')),
+                ('status', models.CharField(choices=[('running', 'En ejecución'), ('success', 'Completada'), ('failure', 'Con errores')], default='running', max_length=10, verbose_name='status')),
+                ('started', models.DateTimeField(default=django.utils.timezone.now, verbose_name='started')),
+                ('finished', models.DateTimeField(default=None, null=True, verbose_name='finished')),
+                ('rebuild_seconds', models.FloatField(default=0, verbose_name='virtual rebuild seconds')),
+                ('error', models.TextField(default=None, null=True, verbose_name='error')),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_runs', to='setting.connection', verbose_name='connection')),
+            ],
+            options={
+                'verbose_name': 'sync run',
+                'verbose_name_plural': 'sync runs',
+                'ordering': ['-started'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncTableRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='updated')),
+                ('table', models.CharField(max_length=255, verbose_name='table')),
+                ('is_virtual', models.BooleanField(default=False, verbose_name='is virtual')),
+                ('strategy', models.CharField(default=None, max_length=20, null=True, verbose_name='strategy')),
+                ('started', models.DateTimeField(default=django.utils.timezone.now, verbose_name='started')),
+                ('finished', models.DateTimeField(default=None, null=True, verbose_name='finished')),
+                ('extract_seconds', models.FloatField(default=0, verbose_name='extract seconds')),
+                ('transform_seconds', models.FloatField(default=0, verbose_name='transform seconds')),
+                ('load_seconds', models.FloatField(default=0, verbose_name='load seconds')),
+                ('rebuild_seconds', models.FloatField(default=0, verbose_name='virtual rebuild seconds')),
+                ('rows_read', models.BigIntegerField(default=0, verbose_name='rows read')),
+                ('rows_written', models.BigIntegerField(default=0, verbose_name='rows written')),
+                ('bytes', models.BigIntegerField(default=0, verbose_name='bytes')),
+                ('error', models.TextField(default=None, null=True, verbose_name='error')),
+                ('sync_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tables', to='setting.syncrun', verbose_name='sync run')),
+            ],
+            options={
+                'verbose_name': 'sync table run',
+                'verbose_name_plural': 'sync table runs',
+                'ordering': ['started'],
+            },
+        ),
+    ]
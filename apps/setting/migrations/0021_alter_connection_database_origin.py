@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0020_syncrun_synctablerun'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='connection',
+            name='database_origin',
+            field=models.CharField(choices=[('MySQL', 'MySQL'), ('PostgreSQL', 'PostgreSQL')], default='MySQL', max_length=10, verbose_name='database origin'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.8 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('setting', '0021_alter_connection_database_origin'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='syncrun',
+            index=models.Index(fields=['connection', 'started'], name='setting_syn_connect_efa3a7_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ import json
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 # Create your models here.
@@ -14,13 +15,34 @@ from apps.core.models import ModelBase, SynchronizedTables
 class Connection(ModelBase):
     DB = 0
     API = 1
+    BINLOG = 2
     TYPES = (
         (DB, "Base de Datos"),
         # (API, "API")
+        (BINLOG, "Binlog de MySQL"),
     )
+    DATABASE_TYPES = (DB, BINLOG)
     MySQL = 'MySQL'
+    PostgreSQL = 'PostgreSQL'
     DATABASES_ORIGIN = (
         (MySQL, "MySQL"),
+        (PostgreSQL, "PostgreSQL"),
+    )
+    COPY = 'COPY'
+    INSERT = 'INSERT'
+    LOADERS = (
+        (COPY, "COPY"),
+        (INSERT, "INSERT"),
+    )
+    FULL = 'full'
+    INCREMENTAL = 'incremental'
+    HASH = 'hash'
+    TRIGGER = 'trigger'
+    STRATEGIES = (
+        (FULL, "Completa"),
+        (INCREMENTAL, "Incremental"),
+        (HASH, "Diferencial por hash"),
+        (TRIGGER, "Changelog por triggers"),
     )
     description = models.CharField(max_length=255, verbose_name=_('description'), null=True, blank=None)
     host = models.CharField(max_length=255, verbose_name=_('host connection'), null=True, blank=None)
@@ -49,19 +71,118 @@ class Connection(ModelBase):
         max_length=25, verbose_name=_('period interval'), default=IntervalSchedule.SECONDS, blank=None
     )
     is_active = models.BooleanField(verbose_name=_('is active'), default=True)
+    batch_size = models.IntegerField(verbose_name=_('batch size'), default=5000)
+    loader = models.CharField(max_length=10, verbose_name=_('loader'), default=COPY, choices=LOADERS)
+    full_sync_interval = models.IntegerField(verbose_name=_('full sync interval (hours)'), default=0)
+    adaptive_interval = models.BooleanField(verbose_name=_('adaptive interval'), default=False)
+    min_interval = models.IntegerField(verbose_name=_('min interval (seconds)'), default=10)
+    max_interval = models.IntegerField(verbose_name=_('max interval (seconds)'), default=3600)
+    max_rows_per_second = models.IntegerField(verbose_name=_('max rows per second'), default=0)
+    max_bytes_per_second = models.IntegerField(verbose_name=_('max bytes per second'), default=0)
+    max_source_connections = models.IntegerField(verbose_name=_('max source connections per host'), default=0)
+    batch_pause = models.IntegerField(verbose_name=_('pause between batches (ms)'), default=0)
+    binlog_file = models.CharField(max_length=255, verbose_name=_('binlog file'), default=None, null=True)
+    binlog_position = models.BigIntegerField(verbose_name=_('binlog position'), default=None, null=True)
 
     def __str__(self):
-        if self.type == Connection.DB:
+        if self.type in Connection.DATABASE_TYPES:
             return self.description + " " + self.database_origin + " ("+str(self.id) + ")"
         else:
             return self.description + " (" + str(self.id) + ")"
 
 
+class SyncCheckpoint(ModelBase):
+    connection = models.ForeignKey(
+        Connection,
+        verbose_name=_('connection'),
+        related_name=_('checkpoints'),
+        on_delete=models.CASCADE
+    )
+    run_id = models.UUIDField(verbose_name=_('run id'))
+    table_origin = models.CharField(max_length=255, verbose_name=_('table origin'))
+    last_key = models.CharField(max_length=255, verbose_name=_('last key'), default=None, null=True)
+    rows = models.BigIntegerField(verbose_name=_('rows'), default=0)
+    is_completed = models.BooleanField(verbose_name=_('is completed'), default=False)
+
+    class Meta:
+        verbose_name = _('sync checkpoint')
+        verbose_name_plural = _('sync checkpoints')
+        unique_together = ('connection', 'table_origin')
+
+    def __str__(self):
+        return self.table_origin + " (" + str(self.run_id) + ")"
+
+
+class SyncRun(ModelBase):
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    FAILURE = 'failure'
+    STATUS = (
+        (RUNNING, "En ejecución"),
+        (SUCCESS, "Completada"),
+        (FAILURE, "Con errores"),
+    )
+    connection = models.ForeignKey(
+        Connection,
+        verbose_name=_('connection'),
+        related_name=_('sync_runs'),
+        on_delete=models.CASCADE
+    )
+    task_id = models.CharField(max_length=255, verbose_name=_('task id'), default=None, null=True)
+    full = models.BooleanField(verbose_name=_('full'), default=False)
+    status = models.CharField(max_length=10, verbose_name=_('status'), default=RUNNING, choices=STATUS)
+    started = models.DateTimeField(verbose_name=_('started'), default=timezone.now)
+    finished = models.DateTimeField(verbose_name=_('finished'), default=None, null=True)
+    rebuild_seconds = models.FloatField(verbose_name=_('virtual rebuild seconds'), default=0)
+    error = models.TextField(verbose_name=_('error'), default=None, null=True)
+
+    class Meta:
+        verbose_name = _('sync run')
+        verbose_name_plural = _('sync runs')
+        ordering = ['-started']
+        indexes = [
+            models.Index(fields=['connection', 'started']),
+        ]
+
+    def __str__(self):
+        return str(self.connection_id) + " " + str(self.started) + " (" + self.status + ")"
+
+
+class SyncTableRun(ModelBase):
+    sync_run = models.ForeignKey(
+        SyncRun,
+        verbose_name=_('sync run'),
+        related_name=_('tables'),
+        on_delete=models.CASCADE
+    )
+    table = models.CharField(max_length=255, verbose_name=_('table'))
+    is_virtual = models.BooleanField(verbose_name=_('is virtual'), default=False)
+    strategy = models.CharField(max_length=20, verbose_name=_('strategy'), default=None, null=True)
+    started = models.DateTimeField(verbose_name=_('started'), default=timezone.now)
+    finished = models.DateTimeField(verbose_name=_('finished'), default=None, null=True)
+    extract_seconds = models.FloatField(verbose_name=_('extract seconds'), default=0)
+    transform_seconds = models.FloatField(verbose_name=_('transform seconds'), default=0)
+    load_seconds = models.FloatField(verbose_name=_('load seconds'), default=0)
+    rebuild_seconds = models.FloatField(verbose_name=_('virtual rebuild seconds'), default=0)
+    rows_read = models.BigIntegerField(verbose_name=_('rows read'), default=0)
+    rows_written = models.BigIntegerField(verbose_name=_('rows written'), default=0)
+    bytes = models.BigIntegerField(verbose_name=_('bytes'), default=0)
+    error = models.TextField(verbose_name=_('error'), default=None, null=True)
+
+    class Meta:
+        verbose_name = _('sync table run')
+        verbose_name_plural = _('sync table runs')
+        ordering = ['started']
+
+    def __str__(self):
+        return self.table + " (" + str(self.sync_run_id) + ")"
+
+
 def post_save_connection(sender, instance: Connection, **kwargs):
     created = kwargs['created']
-    from ibartionmap.utils.functions import get_name_table
+    from ibartionmap.utils.functions import get_name_table, get_tables_selected
     if created:
-        if instance.type == Connection.DB and instance.info_to_sync_selected:
+        if instance.type in Connection.DATABASE_TYPES and instance.info_to_sync_selected:
             schedule, created = IntervalSchedule.objects.get_or_create(
                 every=instance.every_interval,
                 period=instance.period_interval
@@ -76,7 +197,7 @@ def post_save_connection(sender, instance: Connection, **kwargs):
             instance.periodic_task_id = periodic_task.id
             instance.save(update_fields=["periodic_task_id"])
     else:
-        for table_origin in instance.info_to_sync_selected:
+        for table_origin in get_tables_selected(instance):
             try:
                 synchronized_table = SynchronizedTables.objects.get(connection_id=instance.id, table_origin=table_origin)
                 if not synchronized_table.is_active:
@@ -100,9 +221,9 @@ def post_save_connection(sender, instance: Connection, **kwargs):
         SynchronizedTables.objects.filter(
             connection_id=instance.id
         ).exclude(
-            table_origin__in=instance.info_to_sync_selected
+            table_origin__in=get_tables_selected(instance)
         ).update(is_active=False)
-        if instance.type == Connection.DB and instance.info_to_sync_selected:
+        if instance.type in Connection.DATABASE_TYPES and instance.info_to_sync_selected:
             try:
                 periodic_task: PeriodicTask = PeriodicTask.objects.get(
                     id=instance.periodic_task_id
@@ -111,9 +232,13 @@ def post_save_connection(sender, instance: Connection, **kwargs):
                     every=instance.every_interval,
                     period=instance.period_interval
                 )
-                periodic_task.interval = schedule
                 periodic_task.enabled = instance.is_active
-                periodic_task.save(update_fields=['enabled', 'interval'])
+                update_fields = ['enabled']
+                if not instance.adaptive_interval:
+                    # An adaptive schedule is set by the runs from the intervals of the tables
+                    periodic_task.interval = schedule
+                    update_fields.append('interval')
+                periodic_task.save(update_fields=update_fields)
             except ObjectDoesNotExist:
                 schedule, created = IntervalSchedule.objects.get_or_create(
                     every=instance.every_interval,
@@ -1,9 +1,17 @@
+import re
+
 from django_celery_beat.models import IntervalSchedule
 from django_celery_results.models import TaskResult
 from django_restql.mixins import DynamicFieldsMixin
+from redis import RedisError
 from rest_framework import serializers
 
-from apps.setting.models import Connection
+from apps.setting.models import Connection, SyncRun, SyncTableRun
+from ibartionmap.utils.functions import get_table_key, is_integer_type
+from ibartionmap.utils.locks import get_sync_status
+
+# Table and column names are interpolated in the SQL of the sync, only plain identifiers are accepted
+IDENTIFIER_PATTERN = re.compile(r"\w+")
 
 
 class InfoToSyncSerializer(DynamicFieldsMixin, serializers.Serializer):
@@ -11,9 +19,113 @@ class InfoToSyncSerializer(DynamicFieldsMixin, serializers.Serializer):
     fields = serializers.ListField(required=True)
 
 
+class TableSelectedField(serializers.Field):
+    """
+        # Nombre de la tabla o un objeto con la tabla y sus opciones de sincronización
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            if not IDENTIFIER_PATTERN.fullmatch(data):
+                raise serializers.ValidationError("Nombre de tabla no válido: {0}".format(data))
+            return data
+        if not isinstance(data, dict) or not isinstance(data.get('table'), str):
+            raise serializers.ValidationError("Debe indicar el nombre de la tabla")
+        if not IDENTIFIER_PATTERN.fullmatch(data['table']):
+            raise serializers.ValidationError("Nombre de tabla no válido: {0}".format(data['table']))
+        for name in ('key', 'watermark'):
+            if data.get(name) is not None and not (
+                    isinstance(data[name], str) and IDENTIFIER_PATTERN.fullmatch(data[name])):
+                raise serializers.ValidationError("El campo {0} debe ser el nombre de una columna".format(name))
+        strategy = data.get('strategy', Connection.FULL)
+        if strategy not in dict(Connection.STRATEGIES):
+            raise serializers.ValidationError("Estrategia de sincronización no válida: {0}".format(strategy))
+        if strategy == Connection.INCREMENTAL and not (data.get('key') and data.get('watermark')):
+            raise serializers.ValidationError("La sincronización incremental requiere los campos key y watermark")
+        if strategy == Connection.HASH and not data.get('key'):
+            raise serializers.ValidationError("La sincronización por hash requiere el campo key")
+        partitions = data.get('partitions', 1)
+        if not isinstance(partitions, int) or isinstance(partitions, bool) or partitions < 1:
+            raise serializers.ValidationError("El campo partitions debe ser un entero mayor que cero")
+        if not isinstance(data.get('swap', False), bool):
+            raise serializers.ValidationError("El campo swap debe ser un booleano")
+        return data
+
+    def to_representation(self, value):
+        return value
+
+
 class ConnectionDefaultSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     info_to_sync = InfoToSyncSerializer(many=True, required=False)
-    info_to_sync_selected = serializers.ListField(child=serializers.CharField(max_length=255), required=False)
+    info_to_sync_selected = serializers.ListField(child=TableSelectedField(), required=False)
+    sync_status = serializers.SerializerMethodField(read_only=True)
+
+    def get_sync_status(self, connection: Connection):
+        try:
+            return get_sync_status(connection.id)
+        except RedisError:
+            return None
+
+    def validate(self, attrs):
+        min_interval = attrs.get('min_interval', self.instance.min_interval if self.instance else 10)
+        max_interval = attrs.get('max_interval', self.instance.max_interval if self.instance else 3600)
+        if min_interval < 1 or max_interval < min_interval:
+            raise serializers.ValidationError(detail={
+                'error': "El intervalo mínimo debe ser mayor que cero y no superar el intervalo máximo"
+            })
+        tables_selected = attrs.get(
+            'info_to_sync_selected', self.instance.info_to_sync_selected if self.instance else []
+        )
+        info_to_sync = attrs.get('info_to_sync', self.instance.info_to_sync if self.instance else [])
+        fields_tables = {info.get('table'): info.get('fields') or [] for info in info_to_sync}
+        # Only a new selection or a new table definition is checked, other updates keep working even if the
+        # source changed since the tables were selected
+        if 'info_to_sync_selected' in attrs or 'info_to_sync' in attrs:
+            for table_selected in tables_selected:
+                error = self.validate_table_selected(table_selected, fields_tables)
+                if error:
+                    raise serializers.ValidationError(detail={'error': error})
+        database_origin = attrs.get(
+            'database_origin', self.instance.database_origin if self.instance else Connection.MySQL
+        )
+        if database_origin != Connection.MySQL:
+            # The binlog, the changelog triggers and the key range extraction read MySQL internals
+            connection_type = attrs.get('type', self.instance.type if self.instance else Connection.DB)
+            if connection_type == Connection.BINLOG:
+                raise serializers.ValidationError(detail={
+                    'error': "El binlog solo está disponible para conexiones MySQL"
+                })
+            for table_selected in tables_selected:
+                if isinstance(table_selected, dict) and table_selected.get('strategy') == Connection.TRIGGER:
+                    raise serializers.ValidationError(detail={
+                        'error': "La estrategia trigger solo está disponible para conexiones MySQL"
+                    })
+        return attrs
+
+    @staticmethod
+    def validate_table_selected(table_selected, fields_tables):
+        """
+            # Comprueba las opciones de una tabla seleccionada contra las columnas de la tabla en info_to_sync
+            :param table_selected:
+            :param fields_tables: {tabla de origen: campos de la tabla}
+            :return: str, el error o None
+        """
+        if not isinstance(table_selected, dict) or not fields_tables:
+            # Without the tables of the source only the format of the names is checked
+            return None
+        table = table_selected['table']
+        if table not in fields_tables:
+            return "La tabla {0} no existe en la base de datos de origen".format(table)
+        types = {field.get('Field'): field.get('Type', "") for field in fields_tables[table]}
+        for name in ('key', 'watermark'):
+            if table_selected.get(name) and table_selected[name] not in types:
+                return "El campo {0} de la tabla {1} no es una columna de la tabla: {2}".format(
+                    name, table, table_selected[name]
+                )
+        key = get_table_key(table_selected, fields_tables[table])
+        if table_selected.get('partitions', 1) > 1 and not (key and is_integer_type(types.get(key, ""))):
+            return "La tabla {0} solo se puede dividir en partitions con una clave entera".format(table)
+        return None
 
     class Meta:
         model = Connection
@@ -26,6 +138,26 @@ class TaskResultDefaultSerializer(serializers.ModelSerializer):
         fields = serializers.ALL_FIELDS
 
 
+class SyncTableRunDefaultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SyncTableRun
+        exclude = ('sync_run',)
+
+
+class SyncRunDefaultSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    tables = SyncTableRunDefaultSerializer(many=True, read_only=True)
+    seconds = serializers.SerializerMethodField(read_only=True)
+
+    def get_seconds(self, sync_run: SyncRun):
+        if sync_run.finished is None:
+            return None
+        return (sync_run.finished - sync_run.started).total_seconds()
+
+    class Meta:
+        model = SyncRun
+        fields = serializers.ALL_FIELDS
+
+
 class IntervalScheduleSerializer(serializers.ModelSerializer):
     class Meta:
         model = IntervalSchedule
@@ -1,85 +1,733 @@
-import json
+import datetime
+import time
+import uuid
 
-from celery import shared_task
+import psycopg2
+import pymysql.cursors
+from celery import shared_task, chord, group
+from celery.exceptions import Retry
 
 # Sincronización de tablas o recursos
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from django_celery_beat.models import IntervalSchedule, PeriodicTask
 
 from apps.core.models import SynchronizedTables
-from apps.setting.models import Connection
-from ibartionmap.utils.functions import connect_with_mysql, PythonObjectEncoder, get_name_table, connect_with_on_map, \
-    formatter_field, create_table_virtual
+from apps.setting.models import Connection, SyncCheckpoint, SyncRun, SyncTableRun
+from ibartionmap import settings
+from ibartionmap.utils.functions import connect_with_mysql, get_name_table, connect_with_on_map, \
+    get_table_options, get_table_key, is_integer_type, get_dependent_virtual_tables, \
+    rebuild_virtual_tables
+from ibartionmap.utils.binlog import BinlogTable, tail_binlog, get_binlog_position
+from ibartionmap.utils.changelog import read_changelog, trim_changelog
+from ibartionmap.utils.checksums import RangeChecksum
+from ibartionmap.utils.connectors import get_connector
+from ibartionmap.utils.schema import reconcile_tables, get_source_tables, get_fingerprint, get_mirror_columns, \
+    diff_table, UNCHANGED
+from ibartionmap.utils.throttle import SourceSlotUnavailable
+from ibartionmap.utils.locks import acquire_sync_lock, queue_sync, release_sync_lock, extend_sync_lock, \
+    keep_sync_lock
+from ibartionmap.utils.loaders import get_loader, load_upsert, load_diff, get_hash_table, load_swap, \
+    load_partitioned, load_resumable, load_changelog
+
+RETRY_ERRORS = (pymysql.err.OperationalError, psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def full_sync_due(instance: Connection, synchronized_table: SynchronizedTables):
+    if synchronized_table.watermark is None or synchronized_table.last_full_sync is None:
+        return True
+    if not instance.full_sync_interval:
+        return False
+    return timezone.now() - synchronized_table.last_full_sync >= datetime.timedelta(hours=instance.full_sync_interval)
+
+
+def release_connection_lock(connection_id, token):
+    """
+        # Libera el bloqueo de sincronización de la conexión y lanza la ejecución que quedó pendiente
+        # mientras estaba tomado, solo si este token todavía tenía el bloqueo
+        :param connection_id:
+        :param token:
+    """
+    queued = release_sync_lock(connection_id, token)
+    if queued:
+        sync_with_connection.delay(connection_id, queued == "full")
+
+
+def get_fields_table(instance: Connection, table_origin):
+    for info in instance.info_to_sync:
+        if info.get('table') == table_origin:
+            fields_table = info.get('fields')
+            for field in fields_table:
+                field["selected"] = False
+            return fields_table
+    return None
+
+
+def sync_table(instance: Connection, synchronized_table: SynchronizedTables, options, fields_table, connection,
+               connection_on_map, full=False, checkpoint: SyncCheckpoint = None):
+    fields = [field["Field"] for field in fields_table]
+    if not fields:
+        return None
+
+    table_origin = options["table"]
+    table_name = get_name_table(instance, table_origin)
+    strategy = options.get("strategy", Connection.FULL)
+    connector = get_connector(instance)
+    if strategy == Connection.TRIGGER and not connector.supports_triggers:
+        return {
+            "sql": "",
+            "fields_table": fields_table,
+            "error": "La estrategia trigger solo está disponible para conexiones MySQL"
+        }
+    watermark = None
+    if strategy == Connection.INCREMENTAL:
+        # The high-water mark is read before extracting, rows written meanwhile are picked up by the next run
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT MAX({0}) AS watermark FROM {1}".format(options["watermark"], table_origin))
+            watermark = cursor.fetchone()["watermark"]
+    elif strategy == Connection.TRIGGER:
+        # The entries read now are applied (or covered by a full load) and deleted after the load, entries
+        # that commit meanwhile are left for the next run whatever their id
+        changelog_ids, keys = read_changelog(connection, table_origin)
+        watermark = max(changelog_ids, default=0)
+    incremental = strategy in (Connection.INCREMENTAL, Connection.TRIGGER) and not full and \
+        not full_sync_due(instance, synchronized_table)
+    if incremental and watermark is None:
+        return {"table": table_name, "strategy": strategy, "rows": 0}
+
+    sql = connector.get_select(table_origin, fields)
+    params = None
+    if incremental and strategy == Connection.INCREMENTAL:
+        sql += " WHERE {0} >= %s AND {0} <= %s".format(options["watermark"])
+        params = (synchronized_table.watermark, watermark)
+    batches = connector.stream_query(connection, sql, params, instance.batch_size)
+    key = get_table_key(options, fields_table)
+    types = {field["Field"]: field["Type"] for field in fields_table}
+    partitions = int(options.get("partitions") or 1)
+    try:
+        cursor_on_map = connection_on_map.cursor()
+        if strategy == Connection.HASH:
+            sql = "DIFF " + table_name
+            if full:
+                # Forgetting the stored hashes makes every row be rewritten once
+                cursor_on_map.execute("DROP TABLE IF EXISTS " + get_hash_table(table_name))
+            loader = load_diff(connection_on_map, table_name, fields, options["key"], batches)
+        elif incremental and strategy == Connection.TRIGGER:
+            sql = "CHANGELOG " + table_name
+            if key is None:
+                raise ValueError("La tabla necesita una clave primaria simple o la opción key")
+            loader = load_changelog(
+                instance, connection, connection_on_map, table_origin, table_name, fields, key, keys
+            )
+        elif incremental:
+            sql = "UPSERT " + table_name
+            loader = load_upsert(instance, connection_on_map, table_name, fields, options["key"], batches)
+        elif partitions > 1 and key and connector.supports_partitions and is_integer_type(types.get(key, "")):
+            # Integer key ranges are extracted and loaded concurrently into a staging table that is then swapped
+            # in, other keys can't be split in ranges and use a single stream
+            sql = "PARTITIONED " + table_name
+            loader = load_partitioned(
+                instance, connection, connection_on_map, table_origin, table_name, fields, key, partitions
+            )
+        elif options.get("swap") and checkpoint and key and connector.supports_partitions and \
+                is_integer_type(types.get(key, "")):
+            # Every batch is committed to the staging table and checkpointed, a retry continues from the last key
+            sql = "SWAP " + table_name
+            rows = checkpoint.rows
+
+            def save_checkpoint(last_key, loaded):
+                checkpoint.last_key = last_key
+                checkpoint.rows = rows + loaded
+                checkpoint.save(update_fields=['last_key', 'rows', 'updated'])
+
+            loader = load_resumable(
+                instance, connection, connection_on_map, table_origin, table_name, fields, key, checkpoint.last_key,
+                save_checkpoint
+            )
+        elif options.get("swap"):
+            # Readers keep seeing the previous data until the staging table is swapped in
+            sql = "SWAP " + table_name
+            loader = load_swap(instance, connection_on_map, table_name, fields, batches)
+        else:
+            sql = "DELETE FROM " + table_name
+            cursor_on_map.execute(sql)
+
+            # Each batch is loaded as soon as it arrives; the DELETE and the load are
+            # committed together so readers never see a half loaded table
+            sql = instance.loader + " " + table_name
+            loader = None
+            if instance.loader == Connection.COPY:
+                # A PostgreSQL source is piped from its own COPY TO straight into the COPY FROM of the mirror
+                loader = connector.copy_table(connection, connection_on_map, table_origin, table_name, fields)
+            if loader is None:
+                loader = get_loader(instance, connection_on_map, table_name, fields)
+                loader.load(batches)
+        connection_on_map.commit()
+    except Exception as e:
+        if not connection_on_map.closed:
+            connection_on_map.rollback()
+        if isinstance(e, RETRY_ERRORS):
+            raise
+        return {
+            "sql": sql,
+            "fields_table": fields_table,
+            "error": e.__str__()
+        }
+
+    if strategy == Connection.TRIGGER:
+        trim_changelog(connection, changelog_ids)
+    update_fields = {}
+    if strategy in (Connection.INCREMENTAL, Connection.TRIGGER) and watermark is not None:
+        update_fields['watermark'] = str(watermark)
+    if not incremental:
+        update_fields['last_full_sync'] = timezone.now()
+    SynchronizedTables.objects.filter(id=synchronized_table.id).update(**update_fields)
+    stats = loader.stats()
+    stats["strategy"] = strategy if strategy == Connection.HASH or incremental else Connection.FULL
+    return stats
+
+
+def get_synchronized_table(instance: Connection, table_origin, fields_table):
+    try:
+        return SynchronizedTables.objects.get(
+            table_origin=table_origin, connection_id=instance.id, is_virtual=False
+        )
+    except ObjectDoesNotExist:
+        return SynchronizedTables.objects.create(
+            table_origin=table_origin,
+            table=get_name_table(instance, table_origin),
+            alias="",
+            fields=fields_table,
+            is_virtual=False,
+            connection=instance
+        )
+
+
+def get_changed_rows(stats):
+    if "changed" in stats:
+        return stats["changed"] + stats.get("deleted", 0)
+    return stats.get("rows", 0)
+
+
+def save_table_run(run_id, stats, started, is_virtual=False):
+    """
+    Records the timings and volumes of a table in the history of its run.
+    """
+    if not run_id or not stats:
+        return
+    SyncTableRun.objects.create(
+        sync_run_id=run_id,
+        table=stats.get("table", ""),
+        is_virtual=is_virtual,
+        strategy=stats.get("strategy"),
+        started=started,
+        finished=timezone.now(),
+        extract_seconds=stats.get("extract_seconds", 0),
+        transform_seconds=stats.get("transform_seconds", 0),
+        load_seconds=stats.get("load_seconds", 0),
+        rebuild_seconds=stats.get("seconds", 0) if is_virtual else 0,
+        rows_read=stats.get("rows", 0) if not is_virtual else 0,
+        rows_written=0 if stats.get("error") else get_changed_rows(stats),
+        bytes=stats.get("bytes", 0),
+        error=stats.get("error")
+    )
+
+
+def prune_sync_runs(connection_id):
+    """
+    Deletes the runs of the connection older than SYNC_RUN_RETENTION_DAYS, their tables go with them.
+    """
+    SyncRun.objects.filter(
+        connection_id=connection_id,
+        started__lt=timezone.now() - datetime.timedelta(days=settings.SYNC_RUN_RETENTION_DAYS)
+    ).delete()
+
+
+def adapt_table_interval(instance: Connection, synchronized_table: SynchronizedTables, changed_rows,
+                         run_started=None):
+    """
+    Idle tables double their sync interval up to max_interval, tables with changes halve it down to min_interval.
+    The next sync counts from the start of the run, like the ticks of the periodic task.
+    """
+    update_fields = {"changed_rows": changed_rows}
+    if instance.adaptive_interval:
+        interval = synchronized_table.sync_interval or instance.min_interval
+        if changed_rows:
+            interval = max(interval // 2, instance.min_interval)
+        else:
+            interval = min(interval * 2, instance.max_interval)
+        update_fields["sync_interval"] = interval
+        update_fields["next_sync"] = (run_started or timezone.now()) + datetime.timedelta(seconds=interval)
+    SynchronizedTables.objects.filter(id=synchronized_table.id).update(**update_fields)
+
+
+def adapt_connection_interval(instance: Connection):
+    """
+    The periodic task runs as often as the most active table of the connection needs.
+    """
+    if not instance.adaptive_interval or not instance.periodic_task_id:
+        return
+    intervals = SynchronizedTables.objects.filter(
+        connection_id=instance.id, is_virtual=False, is_active=True, sync_interval__isnull=False
+    ).values_list('sync_interval', flat=True)
+    every = max(min(intervals, default=instance.min_interval), instance.min_interval)
+    schedule, created = IntervalSchedule.objects.get_or_create(every=every, period=IntervalSchedule.SECONDS)
+    periodic_task: PeriodicTask = instance.periodic_task
+    if periodic_task.interval_id != schedule.id:
+        periodic_task.interval = schedule
+        periodic_task.save(update_fields=['interval'])
+
+
+def dispatch_sync(instance: Connection, full, token):
+    connection_id = str(instance.id)
+    run_id = str(uuid.uuid4())
+    checkpoints = SyncCheckpoint.objects.filter(connection_id=connection_id)
+    interrupted = None
+    if not full:
+        # A run whose worker died before its chord callback is resumed for a while: its completed tables
+        # are skipped. Runs that reached the callback have no checkpoints left
+        interrupted = SyncRun.objects.filter(
+            connection_id=connection_id, status=SyncRun.RUNNING,
+            started__gte=timezone.now() - datetime.timedelta(seconds=settings.SYNC_RESUME_WINDOW),
+            id__in=checkpoints.values('run_id')
+        ).order_by('-started').first()
+    if interrupted:
+        # This run holds the lock, so the interrupted one lost it: its subtasks that haven't started yet
+        # check the lock and leave their tables to this run, and the running ones keep it extended
+        checkpoints.exclude(run_id=interrupted.id).delete()
+        # The checkpoints move to the new run, that records its own history
+        checkpoints.update(run_id=run_id)
+        SyncRun.objects.filter(id=interrupted.id).update(
+            status=SyncRun.FAILURE, finished=timezone.now(), error="Interrumpida, continuada por " + run_id
+        )
+    else:
+        checkpoints.delete()
+    completed = checkpoints.filter(run_id=run_id, is_completed=True).values_list('table_origin', flat=True)
+    next_sync = {}
+    if instance.adaptive_interval and not full:
+        # Half of min_interval absorbs the delay between a tick and the start of its run, a table due
+        # around the tick is synced on it instead of on the next one
+        due = timezone.now() + datetime.timedelta(seconds=instance.min_interval / 2)
+        next_sync = dict(SynchronizedTables.objects.filter(
+            connection_id=instance.id, is_virtual=False, next_sync__gt=due
+        ).values_list('table_origin', 'next_sync'))
+    tables = []
+    for table_selected in instance.info_to_sync_selected:
+        table_origin = get_table_options(table_selected)["table"]
+        if get_fields_table(instance, table_origin) is None:
+            break
+        # Tables that backed off are left out until their next sync is due
+        if table_origin not in completed and table_origin not in next_sync:
+            tables.append(table_origin)
+    SyncRun.objects.create(id=run_id, connection=instance, full=full)
+    # One subtask per table so they can run on any worker, virtual tables are rebuilt once all of them end
+    try:
+        result = chord(
+            group(
+                sync_connection_table.s(connection_id, table_origin, full, run_id, token) for table_origin in tables
+            ),
+            refresh_virtual_tables.s(connection_id, run_id, token)
+        ).apply_async()
+    except Exception as e:
+        SyncRun.objects.filter(id=run_id).update(status=SyncRun.FAILURE, finished=timezone.now(), error=e.__str__())
+        raise
+    SyncRun.objects.filter(id=run_id).update(task_id=result.id)
+    return {"tables": tables, "run_id": run_id, "task_id": result.id}
+
+
+def save_binlog_position(instance: Connection, log_file, log_pos):
+    instance.binlog_file = log_file
+    instance.binlog_position = log_pos
+    Connection.objects.filter(id=instance.id).update(binlog_file=log_file, binlog_position=log_pos)
+
+
+def dispatch_binlog(instance: Connection, token):
+    """
+    Applies the binlog events written since the saved position to the mirror tables, then refreshes the
+    virtual tables that depend on the tables that changed. Tables that never completed a full load, like
+    one that failed in the initial sync or was selected later, are loaded in full first.
+    """
+    connection_id = str(instance.id)
+    tables = {}
+    results = []
+    loaded = []
+    run_id = str(uuid.uuid4())
+    started = timezone.now()
+    SyncRun.objects.create(id=run_id, connection=instance, started=started)
+    try:
+        synced = set(SynchronizedTables.objects.filter(
+            connection_id=instance.id, is_virtual=False, last_full_sync__isnull=False
+        ).values_list('table_origin', flat=True))
+        for table_selected in instance.info_to_sync_selected:
+            table_origin = get_table_options(table_selected)["table"]
+            if table_origin not in synced:
+                # The events since the saved position are replayed over the new load, they are applied by key
+                loaded.append(sync_connection_table(connection_id, table_origin, True, run_id, token))
+
+        for table_selected in instance.info_to_sync_selected:
+            options = get_table_options(table_selected)
+            fields_table = get_fields_table(instance, options["table"])
+            if fields_table is None:
+                continue
+            if get_table_key(options, fields_table) is None:
+                results.append({
+                    "table": get_name_table(instance, options["table"]),
+                    "error": "La tabla necesita una clave primaria simple o la opción key"
+                })
+                continue
+            tables[options["table"]] = BinlogTable(instance, options, fields_table)
+
+        connection_on_map = connect_with_on_map()
+        try:
+            with keep_sync_lock(connection_id, token):
+                tail_binlog(
+                    instance, connection_on_map, tables,
+                    lambda log_file, log_pos: save_binlog_position(instance, log_file, log_pos)
+                )
+        finally:
+            connection_on_map.close()
+
+        for table_origin, table in tables.items():
+            stats = table.stats()
+            stats["strategy"] = "binlog"
+            synchronized_table = get_synchronized_table(instance, table_origin, get_fields_table(instance, table_origin))
+            stats["table_id"] = str(synchronized_table.id)
+            adapt_table_interval(instance, synchronized_table, get_changed_rows(stats), started)
+            results.append(stats)
+        for stats in results:
+            save_table_run(run_id, stats, started)
+        # The full loads recorded their own table runs
+        results += [stats for stats in loaded if stats]
+    except Exception as e:
+        SyncRun.objects.filter(id=run_id).update(status=SyncRun.FAILURE, finished=timezone.now(), error=e.__str__())
+        release_connection_lock(connection_id, token)
+        raise
+    # The virtual tables are refreshed from the changed keys like after a regular sync
+    return refresh_virtual_tables(results, connection_id, run_id, token)
+
+
+def sync_schema(instance: Connection, force=False, on_progress=None):
+    """
+        # Lee la definición de las tablas de origen y reconcilia las tablas espejo de las que cambiaron
+        # desde la última vez, o de todas con force
+        :param instance:
+        :param force:
+        :param on_progress: función que recibe el progreso, con la misma forma que el resultado
+        :return: dict
+    """
+    source_tables = get_source_tables(instance)
+    native = get_connector(instance).native_types
+    fingerprints = {
+        info.get('table'): get_fingerprint(info.get('fields') or []) for info in instance.info_to_sync
+    }
+    connection_on_map = connect_with_on_map()
+    try:
+        # A source that didn't change can still have a mirror with other columns, like the ones created
+        # by an earlier type mapping, so the mirrors are checked too (a single catalog query)
+        mirrors = get_mirror_columns(
+            connection_on_map.cursor(), [get_name_table(instance, table) for table in source_tables]
+        )
+        connection_on_map.commit()
+    finally:
+        connection_on_map.close()
+    changed = {}
+    result = []
+    for table, fields in source_tables.items():
+        table_name = get_name_table(instance, table)
+        fields_table = []
+        for field in fields:
+            if field["Field"].startswith("MAX("):
+                break
+            fields_table.append(field)
+        if not force and fingerprints.get(table) == get_fingerprint(fields) and table_name in mirrors and \
+                not diff_table(table_name, mirrors[table_name], fields_table, native):
+            continue
+        changed[table_name] = fields_table
+        result.append({
+            "table": table,
+            "fields": fields
+        })
+
+    def get_progress(tables):
+        return {
+            "connection": str(instance.id),
+            "total": len(source_tables),
+            "changed": len(changed),
+            "done": len(tables),
+            "tables": tables
+        }
+
+    def report(tables):
+        if on_progress:
+            on_progress(get_progress(tables))
+
+    report({})
+    schema = {}
+    if changed:
+        connection_on_map = connect_with_on_map()
+        try:
+            # Only the mirrors whose source changed are altered, the rest keep their data untouched
+            schema = reconcile_tables(connection_on_map, changed, on_progress=report, native=native)
+        finally:
+            connection_on_map.close()
+    for data in result:
+        table_name = get_name_table(instance, data['table'])
+        try:
+            synchronized_table = SynchronizedTables.objects.get(table=table_name, connection_id=instance.id)
+            synchronized_table.fields = list(data["fields"])
+            update_fields = ['fields']
+            if schema[table_name]["action"] != UNCHANGED:
+                # Rows already in the mirror lack the new columns, the next sync reloads them
+                synchronized_table.last_full_sync = None
+                update_fields.append('last_full_sync')
+            synchronized_table.save(update_fields=update_fields)
+        except ObjectDoesNotExist:
+            SynchronizedTables.objects.create(
+                table_origin=data["table"],
+                table=table_name,
+                alias="",
+                fields=data["fields"],
+                is_virtual=False,
+                connection_id=instance.id
+            )
+
+    # Only the entries of changed tables are rewritten, tables dropped from the source are removed
+    info_to_sync = {info.get('table'): info for info in instance.info_to_sync}
+    info_to_sync.update({data["table"]: data for data in result})
+    info_to_sync = [info_to_sync[table] for table in source_tables]
+    if result or len(info_to_sync) != len(instance.info_to_sync):
+        instance.info_to_sync = info_to_sync
+        instance.save(update_fields=["info_to_sync"])
+    return get_progress(schema)
+
+
+@shared_task(name="sync_tables_connection", bind=True, max_retries=None)
+def sync_tables_connection(self, connection_id, force=False):
+    instance: Connection = Connection.objects.get(id=connection_id)
+    # The mirrors are altered or recreated, the job waits for the running sync instead of racing its loads
+    token = acquire_sync_lock(connection_id)
+    if token is None:
+        raise self.retry(countdown=10)
+
+    def on_progress(progress):
+        self.update_state(state="PROGRESS", meta=progress)
+
+    # An error propagates so the job ends in FAILURE and sync_tables_status reports it
+    try:
+        with keep_sync_lock(connection_id, token):
+            return sync_schema(instance, force, on_progress)
+    finally:
+        release_connection_lock(connection_id, token)
 
 
 @shared_task(name="sync_with_connection")
-def sync_with_connection(connection_id):
+def sync_with_connection(connection_id, full=False):
     try:
         instance: Connection = Connection.objects.get(id=connection_id)
-        if instance.type == Connection.DB and instance.database_origin == Connection.MySQL:
-            # Connect to the database
-            connection = connect_with_mysql(instance)
-            connection_on_map = connect_with_on_map()
-            with connection:
-                for table_origin in instance.info_to_sync_selected:
-                    for info in instance.info_to_sync:
-                        if info.get('table') == table_origin:
-                            for field in info.get('fields'):
-                                field['selected'] = True
-                            fields_table = info.get('fields')
-                            for field in fields_table:
-                                field["selected"] = False
-                            break
-                    if fields_table is None:
-                        break
-                    try:
-                        SynchronizedTables.objects.get(
-                            table_origin=table_origin, connection_id=connection_id, is_virtual=False
-                        )
-                    except ObjectDoesNotExist:
-                        synchronized_table = SynchronizedTables.objects.create(
-                            table_origin=table_origin,
-                            table=get_name_table(instance, table_origin),
-                            alias="",
-                            fields=fields_table,
-                            is_virtual=False,
-                            connection=instance
-                        )
-
-                    fields = [field["Field"] for field in fields_table]
-                    if fields:
-                        with connection.cursor() as cursor:
-                            sql = "SELECT " + ", ".join(map(str, fields)) + " FROM " + table_origin
-                            cursor.execute(sql)
-                            results = cursor.fetchall()
-                            data = json.loads(json.dumps(results, cls=PythonObjectEncoder))
-                            try:
-                                cursor_on_map = connection_on_map.cursor()
-
-                                try:
-                                    sql = "DELETE FROM " + get_name_table(instance, table_origin)
-                                    cursor_on_map.execute(sql)
-                                    print(sql)
-                                except Exception as e:
-                                    print(e.__str__())
-                                    pass
-
-                                sql = "INSERT INTO {0} ({1}) VALUES".format(
-                                    get_name_table(instance, table_origin),
-                                    ", ".join(map(str, data[0].keys()))
-                                )
-                                records = [" ({0})".format(", ".join(map(formatter_field, d.values()))) for d in data]
-                                sql += ", ".join(map(str, records))
-                                cursor_on_map.execute(sql)
-                                connection_on_map.commit()
-                            except Exception as e:
-                                return {
-                                    "sql": sql,
-                                    "fields_table": fields_table,
-                                    "error": e.__str__()
-                                }
-                for table in SynchronizedTables.objects.filter(is_virtual=True, is_active=True):
-                    create_table_virtual(table)
-            connection_on_map.close()
+        if instance.type in Connection.DATABASE_TYPES:
+            token = acquire_sync_lock(connection_id)
+            if token is None:
+                # Another run is in progress, it starts a single follow-up run when it ends
+                queue_sync(connection_id, full)
+                return {"queued": True}
+            try:
+                if instance.type == Connection.BINLOG and not full and instance.binlog_file:
+                    return dispatch_binlog(instance, token)
+                if instance.type == Connection.BINLOG:
+                    # The mirrors are loaded with a full sync, the binlog is then read from the position
+                    # taken before it; events replayed twice are harmless since they are applied by key. A table
+                    # that fails to load has no last_full_sync and the next binlog run loads it in full
+                    save_binlog_position(instance, *get_binlog_position(instance))
+                return dispatch_sync(instance, full, token)
+            except Exception:
+                release_connection_lock(connection_id, token)
+                raise
     except ValueError as e:
         print(e.__str__())
 
+
+@shared_task(name="sync_connection_table", bind=True, max_retries=3)
+def sync_connection_table(self, connection_id, table_origin, full=False, run_id=None, token=None):
+    started = timezone.now()
+    try:
+        if token and not extend_sync_lock(connection_id, token):
+            # The lock expired and a newer run took the connection, that run loads this table
+            raise ValueError("El bloqueo de la sincronización expiró, la tabla la carga la ejecución siguiente")
+        instance: Connection = Connection.objects.get(id=connection_id)
+        options = None
+        for table_selected in instance.info_to_sync_selected:
+            if get_table_options(table_selected)["table"] == table_origin:
+                options = get_table_options(table_selected)
+        fields_table = get_fields_table(instance, table_origin)
+        if options is None or fields_table is None:
+            return None
+        synchronized_table = get_synchronized_table(instance, table_origin, fields_table)
+        checkpoint = None
+        if run_id:
+            checkpoint, created = SyncCheckpoint.objects.get_or_create(
+                connection_id=connection_id, table_origin=table_origin, defaults={'run_id': run_id}
+            )
+            if str(checkpoint.run_id) != run_id:
+                checkpoint.run_id = run_id
+                checkpoint.last_key = None
+                checkpoint.rows = 0
+                checkpoint.is_completed = False
+                checkpoint.save()
+            if checkpoint.is_completed:
+                return None
+
+        # Connect to the database with a cursor that streams the rows instead of buffering the whole table.
+        # When the source has no free connection slot the task is retried later instead of holding the worker
+        connector = get_connector(instance)
+        try:
+            connection = connector.connect(stream=True, wait=False)
+        except SourceSlotUnavailable as e:
+            raise self.retry(exc=e, countdown=settings.SOURCE_SLOT_RETRY, max_retries=None)
+        with connection:
+            connection_on_map = connect_with_on_map()
+            try:
+                # The lock is extended while the table loads, however long it takes
+                with keep_sync_lock(connection_id, token):
+                    # Mirrors created with an older type mapping are altered before loading values converted
+                    # for the current one; a changed mirror is reloaded in full
+                    table_name = get_name_table(instance, table_origin)
+                    schema = reconcile_tables(
+                        connection_on_map, {table_name: fields_table}, native=connector.native_types
+                    )
+                    if schema[table_name]["action"] != UNCHANGED:
+                        full = True
+                    stats = sync_table(
+                        instance, synchronized_table, options, fields_table, connection, connection_on_map, full,
+                        checkpoint
+                    )
+            finally:
+                connection_on_map.close()
+        if stats:
+            stats["table_id"] = str(synchronized_table.id)
+        if stats and not stats.get("error"):
+            run_started = SyncRun.objects.filter(id=run_id).values_list('started', flat=True).first() \
+                if run_id else None
+            adapt_table_interval(instance, synchronized_table, get_changed_rows(stats), run_started or started)
+        if checkpoint and not (stats and stats.get("error")):
+            checkpoint.is_completed = True
+            checkpoint.save(update_fields=['is_completed', 'updated'])
+        save_table_run(run_id, stats, started)
+        return stats
+    except Retry:
+        raise
+    except RETRY_ERRORS as e:
+        # A dropped connection is retried, the checkpoint lets the retry skip what was already loaded
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=30 * (self.request.retries + 1))
+        stats = {
+            "table": table_origin,
+            "error": e.__str__()
+        }
+    except Exception as e:
+        # The chord callback must run even if a table fails
+        stats = {
+            "table": table_origin,
+            "error": e.__str__()
+        }
+    save_table_run(run_id, stats, started)
+    return stats
+
+
+@shared_task(name="refresh_virtual_tables")
+def refresh_virtual_tables(results, connection_id, run_id=None, token=None):
+    rebuilt = []
+    rebuild_seconds = 0
+    error = None
+    try:
+        if run_id:
+            # The run is finished even if some tables failed, the next one starts from scratch
+            SyncCheckpoint.objects.filter(connection_id=connection_id, run_id=run_id).delete()
+        # Only the virtual tables fed by a table that changed are rebuilt
+        changes = {
+            uuid.UUID(stats["table_id"]): {"key": stats["key"], "keys": stats["keys"]} if "keys" in stats else None
+            for stats in results
+            if stats and stats.get("table_id") and not stats.get("error") and get_changed_rows(stats)
+        }
+        start = time.monotonic()
+        with keep_sync_lock(connection_id, token):
+            rebuilt = rebuild_virtual_tables(get_dependent_virtual_tables(changes.keys()), changes=changes)
+        rebuild_seconds = time.monotonic() - start
+        for stats in rebuilt:
+            save_table_run(
+                run_id, stats, timezone.now() - datetime.timedelta(seconds=stats.get("seconds", 0)), True
+            )
+        adapt_connection_interval(Connection.objects.get(id=connection_id))
+        prune_sync_runs(connection_id)
+    except Exception as e:
+        error = e.__str__()
+        raise
+    finally:
+        if run_id:
+            failed = error or [stats for stats in list(results) + rebuilt if stats and stats.get("error")]
+            SyncRun.objects.filter(id=run_id).update(
+                status=SyncRun.FAILURE if failed else SyncRun.SUCCESS,
+                finished=timezone.now(),
+                rebuild_seconds=round(rebuild_seconds, 3),
+                error=error
+            )
+        if token:
+            release_connection_lock(connection_id, token)
+    return {"connection": connection_id, "tables": [stats for stats in results if stats]}
+
+
+@shared_task(name="verify_connection", bind=True, max_retries=None)
+def verify_connection(self, connection_id, repair=True, fanout=16, leaf_rows=1000):
+    instance: Connection = Connection.objects.get(id=connection_id)
+    if instance.type not in Connection.DATABASE_TYPES or instance.database_origin != Connection.MySQL:
+        return None
+    # The repair writes the mirrors, it waits for the running sync instead of racing its loads
+    token = acquire_sync_lock(connection_id)
+    if token is None:
+        raise self.retry(countdown=60)
+    try:
+        with keep_sync_lock(connection_id, token):
+            return verify_tables(instance, repair, fanout, leaf_rows)
+    finally:
+        release_connection_lock(connection_id, token)
+
+
+def verify_tables(instance: Connection, repair, fanout, leaf_rows):
+    connection = connect_with_mysql(instance)
+    connection_on_map = connect_with_on_map()
+    result = []
+    repaired = []
+    with connection:
+        for table_selected in instance.info_to_sync_selected:
+            options = get_table_options(table_selected)
+            fields_table = get_fields_table(instance, options["table"])
+            key = get_table_key(options, fields_table or [])
+            types = {field["Field"]: field["Type"] for field in fields_table or []}
+            if not fields_table or key is None or not is_integer_type(types.get(key, "")):
+                result.append({"table": options["table"], "error": "Table without an integer key"})
+                continue
+            verify = RangeChecksum(
+                instance, options["table"], fields_table, key, connection, connection_on_map, fanout, leaf_rows
+            )
+            try:
+                ranges = verify.mismatches()
+                rows = 0
+                if repair:
+                    for low, high in ranges:
+                        rows += verify.repair(low, high)
+                connection_on_map.rollback()
+                if rows:
+                    repaired += SynchronizedTables.objects.filter(
+                        connection_id=instance.id, table_origin=options["table"], is_virtual=False
+                    ).values_list('id', flat=True)
+                result.append({
+                    "table": verify.table,
+                    "queries": verify.queries,
+                    "ranges": ranges,
+                    "repaired": rows
+                })
+            except Exception as e:
+                connection_on_map.rollback()
+                result.append({"table": verify.table, "error": e.__str__()})
+        rebuild_virtual_tables(get_dependent_virtual_tables(repaired))
+    connection_on_map.close()
+    return {"tables": result}
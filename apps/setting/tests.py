@@ -1,3 +1,137 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from ibartionmap.utils.functions import formatter_copy_field, rebuild_virtual_tables
+from ibartionmap.utils.loaders import IteratorFile, get_key_ranges
+from ibartionmap.utils.schema import diff_table, normalize_pg_type
+from ibartionmap.utils.typemap import get_converter, get_pg_column, get_pg_type, to_temporal
+
+
+class TypeMapTestCase(SimpleTestCase):
+
+    def test_unsigned_integers_are_widened(self):
+        self.assertEqual(get_pg_type("int(11)"), "integer")
+        self.assertEqual(get_pg_type("int(10) unsigned"), "bigint")
+        self.assertEqual(get_pg_type("smallint(5) unsigned"), "integer")
+        self.assertEqual(get_pg_type("bigint(20) unsigned"), "numeric(20,0)")
+
+    def test_tinyint_one_is_boolean(self):
+        self.assertEqual(get_pg_type("tinyint(1)"), "boolean")
+        self.assertEqual(get_pg_type("tinyint(4)"), "smallint")
+        self.assertEqual(get_converter("tinyint(1)")("0"), False)
+        self.assertEqual(get_converter("tinyint(1)")(1), True)
+
+    def test_datetime_keeps_its_precision(self):
+        self.assertEqual(get_pg_type("datetime"), "timestamp without time zone")
+        self.assertEqual(get_pg_type("datetime(6)"), "timestamp(6) without time zone")
+        self.assertEqual(get_pg_type("timestamp(3)"), "timestamp(3) without time zone")
+
+    def test_zero_dates_are_loaded_as_null(self):
+        self.assertIsNone(to_temporal("0000-00-00"))
+        self.assertIsNone(get_converter("datetime")("0000-00-00 00:00:00"))
+        self.assertEqual(to_temporal("2020-01-31"), "2020-01-31")
+        # Dates allow NULL in the mirror even when the source column doesn't
+        field = {"Field": "created", "Type": "date", "Null": "NO"}
+        self.assertEqual(get_pg_column("created", field), "created date")
+
+    def test_native_types_are_kept(self):
+        self.assertEqual(get_pg_type("character varying(20)", native=True), "character varying(20)")
+        field = {"Field": "created", "Type": "date", "Null": "NO"}
+        self.assertEqual(get_pg_column("created", field, native=True), "created date NOT NULL")
+
+
+class DiffTableTestCase(SimpleTestCase):
+
+    def test_normalize_pg_type(self):
+        self.assertEqual(normalize_pg_type("varchar(20)"), "character varying(20)")
+        self.assertEqual(normalize_pg_type("char(2)"), "character(2)")
+        self.assertEqual(normalize_pg_type("char"), "character(1)")
+        self.assertEqual(normalize_pg_type("bigint"), "bigint")
+
+    def test_unchanged_table(self):
+        columns = {"id": ("integer", True), "name": ("character varying(20)", False)}
+        fields = [
+            {"Field": "id", "Type": "int(11)", "Null": "NO"},
+            {"Field": "name", "Type": "varchar(20)", "Null": "YES"},
+        ]
+        self.assertEqual(diff_table("users", columns, fields), [])
+
+    def test_changed_table(self):
+        columns = {"id": ("integer", False), "name": ("text", False), "old": ("text", False)}
+        fields = [
+            {"Field": "id", "Type": "int(11)", "Null": "NO"},
+            {"Field": "name", "Type": "varchar(20)", "Null": "YES"},
+            {"Field": "Email", "Type": "varchar(50)", "Null": "NO"},
+        ]
+        self.assertEqual(diff_table("users", columns, fields), [
+            "ALTER TABLE users ALTER COLUMN id SET NOT NULL",
+            "ALTER TABLE users ALTER COLUMN name TYPE varchar(20) USING NULLIF(name::text, '')::varchar(20)",
+            "ALTER TABLE users ADD COLUMN Email varchar(50)",
+            "ALTER TABLE users DROP COLUMN old",
+        ])
+
+
+class CopyFormatTestCase(SimpleTestCase):
+
+    def test_formatter_copy_field(self):
+        self.assertEqual(formatter_copy_field(None), "\\N")
+        self.assertEqual(formatter_copy_field("a\tb\nc\rd"), "a\\tb\\nc\\rd")
+        self.assertEqual(formatter_copy_field("C:\\temp"), "C:\\\\temp")
+        self.assertEqual(formatter_copy_field("\\N"), "\\\\N")
+        self.assertEqual(formatter_copy_field(10), "10")
+
+    def test_iterator_file(self):
+        lines = ["1\tone\n", "2\ttwo\n", "3\tthree\n"]
+        self.assertEqual(IteratorFile(iter(lines)).read(), "".join(lines))
+        file = IteratorFile(iter(lines))
+        chunks = []
+        chunk = file.read(4)
+        while chunk:
+            self.assertLessEqual(len(chunk), 4)
+            chunks.append(chunk)
+            chunk = file.read(4)
+        self.assertEqual("".join(chunks), "".join(lines))
+
+    def test_get_key_ranges(self):
+        self.assertEqual(get_key_ranges(1, 10, 3), [(1, 5), (5, 9), (9, 11)])
+        self.assertEqual(get_key_ranges(5, 5, 4), [(5, 6)])
+        self.assertEqual(get_key_ranges(1, 3, 10), [(1, 2), (2, 3), (3, 4)])
+
+
+class RebuildVirtualTablesTestCase(SimpleTestCase):
+
+    def rebuild(self, dependencies, failed=()):
+        tables = [SimpleNamespace(id=table_id, table=table_id) for table_id in dependencies]
+        order = []
+
+        def refresh(instance, changes=None):
+            order.append(instance.id)
+            return {"error": "failed"} if instance.id in failed else {"seconds": 0}
+
+        with mock.patch("ibartionmap.utils.functions.get_virtual_dependencies",
+                        side_effect=lambda table: set(dependencies[table.id])), \
+                mock.patch("ibartionmap.utils.functions.refresh_table_virtual", side_effect=refresh):
+            result = rebuild_virtual_tables(tables, parallelism=1)
+        return order, result
+
+    def test_topological_order(self):
+        order, result = self.rebuild({"c": {"b"}, "b": {"a"}, "a": set(), "d": {"a", "c"}})
+        self.assertEqual(order, ["a", "b", "c", "d"])
+        self.assertFalse(any(stats.get("error") for stats in result))
+
+    def test_failure_skips_dependent_tables(self):
+        order, result = self.rebuild({"a": set(), "b": {"a"}, "c": {"b"}, "d": set()}, failed={"a"})
+        result = {stats["table"]: stats for stats in result}
+        self.assertEqual(sorted(order), ["a", "d"])
+        self.assertEqual(result["a"]["error"], "failed")
+        self.assertEqual(result["b"]["error"], "No se reconstruyó la tabla a")
+        self.assertEqual(result["c"]["error"], "No se reconstruyó la tabla b")
+        self.assertNotIn("error", result["d"])
+
+    def test_circular_dependency_is_reported(self):
+        order, result = self.rebuild({"a": {"b"}, "b": {"a"}})
+        self.assertEqual(sorted(order), ["a", "b"])
+        errors = [stats["error"] for stats in result if stats.get("error")]
+        self.assertEqual(errors, ["Dependencia circular entre tablas virtuales: a, b"] * 2)
@@ -1,10 +1,11 @@
 from rest_framework import routers
 
-from .views import ConnectionViewSet, IntervalScheduleViewSet
+from .views import ConnectionViewSet, IntervalScheduleViewSet, SyncRunViewSet
 
 router = routers.SimpleRouter()
 router.register(r'connection', ConnectionViewSet)
 router.register(r'interval_schedule', IntervalScheduleViewSet)
+router.register(r'sync_run', SyncRunViewSet)
 
 urlpatterns = [
 ]
@@ -1,8 +1,9 @@
-from django.core.exceptions import ObjectDoesNotExist
+from celery import states
+from celery.result import AsyncResult
 from django_celery_beat.models import IntervalSchedule
 from django_celery_results.models import TaskResult
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status
+from rest_framework import status, serializers
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter
 from rest_framework.permissions import AllowAny
@@ -10,11 +11,12 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from django_filters import rest_framework as filters
 
-from ibartionmap.utils.functions import connect_with_mysql, connect_with_on_map, get_tipo_mysql_to_pg, get_name_table
-from .models import Connection
-from .serializers import ConnectionDefaultSerializer, TaskResultDefaultSerializer, IntervalScheduleSerializer
-from .tasks import sync_with_connection
-from ..core.models import SynchronizedTables
+from ibartionmap.utils.changelog import install_triggers, uninstall_triggers
+from ibartionmap.utils.planner import plan_connection
+from .models import Connection, SyncRun
+from .serializers import ConnectionDefaultSerializer, TaskResultDefaultSerializer, IntervalScheduleSerializer, \
+    SyncRunDefaultSerializer, TableSelectedField
+from .tasks import sync_with_connection, verify_connection, sync_tables_connection
 
 
 class ConnectionFilter(filters.FilterSet):
@@ -74,88 +76,104 @@ class ConnectionViewSet(ModelViewSet):
         else:
             return Response({"error": "the field parameter is mandatory"}, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(methods=['GET'], detail=True)
+    @action(methods=['GET', 'POST'], detail=True)
     def sync_tables(self, request, pk):
+        """
+        Queue the introspection of the source database and the reconciliation of the mirrors. Tables whose
+        definition didn't change since the last run are skipped, unless force=true.
+        """
+        instance: Connection = self.get_object()
+        if instance.type not in Connection.DATABASE_TYPES:
+            return Response(
+                {"error": "La conexión no es una base de datos"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        force = request.query_params.get('force', request.data.get('force', None)) in (True, 'true', '1')
+        task = sync_tables_connection.delay(str(instance.id), force)
+        return Response({"job_id": task.id}, status=status.HTTP_202_ACCEPTED)
+
+    @action(methods=['GET'], detail=True)
+    def sync_tables_status(self, request, pk):
+        """
+        State of a sync_tables job and the mirrors already reconciled. The job is in RETRY while a sync of the
+        connection holds its lock.
+        """
         instance: Connection = self.get_object()
+        job_id = request.query_params.get('job_id', None)
+        if not job_id:
+            return Response({"error": "El parámetro job_id es obligatorio"}, status=status.HTTP_400_BAD_REQUEST)
+        job = AsyncResult(job_id)
+        data = {"job_id": job_id, "status": job.state}
+        if isinstance(job.info, dict):
+            if job.info.get("connection") not in (None, str(instance.id)):
+                return Response(
+                    {"error": "El trabajo no pertenece a la conexión"}, status=status.HTTP_400_BAD_REQUEST
+                )
+            data.update(job.info)
+        elif job.state == states.FAILURE:
+            data["error"] = str(job.info)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=True)
+    def sync(self, request, pk):
+        """
+        Queue a full reload of every selected table, incremental tables included.
+        """
+        instance: Connection = self.get_object()
+        task = sync_with_connection.delay(str(instance.id), True)
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+
+    @action(methods=['POST'], detail=True)
+    def verify(self, request, pk):
+        """
+        Queue a checksum comparison between the selected tables and their mirrors,
+        re-syncing only the key ranges that differ unless repair=false.
+        """
+        instance: Connection = self.get_object()
+        repair = request.data.get('repair', True) not in (False, 'false', '0')
+        task = verify_connection.delay(str(instance.id), repair)
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+
+    @action(methods=['GET', 'POST'], detail=True)
+    def plan(self, request, pk):
+        """
+        Dry run: estimate the duration and size of the sync of the selected tables, or of the
+        info_to_sync_selected sent in the body, and recommend strategies and every_interval.
+        """
+        instance: Connection = self.get_object()
+        if instance.type not in Connection.DATABASE_TYPES or instance.database_origin != Connection.MySQL:
+            return Response(
+                {"error": "La conexión no es una base de datos MySQL"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        tables_selected = None
+        if request.method == 'POST' and 'info_to_sync_selected' in request.data:
+            serializer = serializers.ListField(child=TableSelectedField())
+            tables_selected = serializer.run_validation(request.data['info_to_sync_selected'])
+        try:
+            return Response(plan_connection(instance, tables_selected), status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": e.__str__()}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['POST', 'DELETE'], detail=True)
+    def triggers(self, request, pk):
+        """
+        Install (POST) or remove (DELETE) the changelog triggers on the source tables
+        selected with the trigger strategy.
+        """
+        instance: Connection = self.get_object()
+        if instance.type not in Connection.DATABASE_TYPES or instance.database_origin != Connection.MySQL:
+            return Response(
+                {"error": "La conexión no es una base de datos MySQL"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         try:
-            result = []
-            if instance.type == Connection.DB and instance.database_origin == Connection.MySQL:
-                # Connect to the database
-                connection = connect_with_mysql(instance)
-                with connection:
-                    with connection.cursor() as cursor:
-                        # Read a single record
-                        sql = "SHOW TABLES"
-                        cursor.execute(sql)
-                        tables = cursor.fetchall()
-
-                    for t in list(tables):
-                        table = t["Tables_in_" + instance.database_name]
-                        with connection.cursor() as cursorTablas:
-                            try:
-                                # Read a single record
-                                sql = "SHOW COLUMNS FROM " + table
-                                cursorTablas.execute(sql)
-                                fields = cursorTablas.fetchall()
-                                result.append({
-                                    "table": table,
-                                    "fields": list(fields)
-                                })
-                            except Exception as e:
-                                return Response({
-                                    "table": table,
-                                    "error": e.__str__()
-                                }, status=status.HTTP_400_BAD_REQUEST)
-                    sql = ""
-                    fields_table = []
-                try:
-                    connection_on_map = connect_with_on_map()
-                    cursor = connection_on_map.cursor()
-                    for data in result:
-                        table_name = get_name_table(instance, data['table'])
-                        fields_table = []
-                        for field in data["fields"]:
-                            if field["Field"].startswith("MAX("):
-                                break
-                            char_null = "NOT NULL" if field["Null"] == "NO" else ""
-                            char_type = get_tipo_mysql_to_pg(field["Type"])
-                            fields_table.append(
-                                "{0} {1} {2}".format(field["Field"], char_type, char_null)
-                            )
-                        sql = "DROP TABLE IF EXISTS {0}".format(table_name)
-                        cursor.execute(sql)
-                        connection_on_map.commit()
-                        sql = "CREATE TABLE {0} ({1});".format(table_name, ", ".join(map(str, fields_table)))
-                        cursor.execute(sql)
-                        connection_on_map.commit()
-                        try:
-                            synchronized_table = SynchronizedTables.objects.get(
-                                table=table_name, connection_id=instance.id
-                            )
-                            synchronized_table.fields = list(data["fields"])
-                            synchronized_table.save(update_fields=['fields'])
-                        except ObjectDoesNotExist:
-                            SynchronizedTables.objects.create(
-                                table_origin=data["table"],
-                                table=table_name,
-                                alias="",
-                                fields=data["fields"],
-                                is_virtual=False,
-                                connection_id=instance.id
-                            )
-                    connection_on_map.close()
-                except Exception as e:
-                    return Response({
-                        "sql": sql,
-                        "fields_table": fields_table,
-                        "error": e.__str__()
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                instance.info_to_sync = result
-                instance.save(update_fields=["info_to_sync"])
-            # result = sync_with_connection(instance.id)
-            return Response(result, status=status.HTTP_200_OK)
+            if request.method == 'DELETE':
+                return Response(uninstall_triggers(instance), status=status.HTTP_200_OK)
+            fields_tables = {info.get('table'): info.get('fields') for info in instance.info_to_sync}
+            return Response(install_triggers(instance, fields_tables), status=status.HTTP_200_OK)
         except Exception as e:
-            return Response(e.__str__(), status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": e.__str__()}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class TaskResultViewSet(ModelViewSet):
@@ -206,6 +224,48 @@ class TaskResultViewSet(ModelViewSet):
             return Response({"error": "the field parameter is mandatory"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class SyncRunFilter(filters.FilterSet):
+    class Meta:
+        model = SyncRun
+        fields = ['connection', 'status', 'full']
+
+
+class SyncRunViewSet(ModelViewSet):
+    queryset = SyncRun.objects.all().select_related('connection').prefetch_related('tables')
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = SyncRunFilter
+    serializer_class = SyncRunDefaultSerializer
+    permission_classes = (AllowAny,)
+    authentication_classes = []
+    http_method_names = ['get', 'delete', 'head', 'options']
+
+    def paginate_queryset(self, queryset):
+        """
+        Return a single page of results, or None if pagination is disabled.
+        """
+        not_paginator = self.request.query_params.get('not_paginator', None)
+        if self.paginator is None or not_paginator:
+            return None
+        return self.paginator.paginate_queryset(queryset, self.request, view=self)
+
+    @action(methods=['GET'], detail=False)
+    def field_options(self, request):
+        field = self.request.query_params.get('field', None)
+        if field:
+            try:
+                choices = []
+                for c in SyncRun._meta.get_field(field).choices:
+                    choices.append({
+                        "value": c[0],
+                        "description": c[1]
+                    })
+                return Response(choices, status=status.HTTP_200_OK)
+            except ValueError as e:
+                return Response(e, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            return Response({"error": "the field parameter is mandatory"}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class IntervalScheduleViewSet(ModelViewSet):
     queryset = IntervalSchedule.objects.all()
     serializer_class = IntervalScheduleSerializer
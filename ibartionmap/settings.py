@@ -256,6 +256,27 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Seconds after which the lock of a connection sync expires if the run never released it
+SYNC_LOCK_TIMEOUT = env.int('SYNC_LOCK_TIMEOUT', default=60 * 60)
+
+# Seconds after which a table sync that found no free connection slot on its source is retried
+SOURCE_SLOT_RETRY = env.int('SOURCE_SLOT_RETRY', default=15)
+
+# Days the history of the sync runs (SyncRun and SyncTableRun) is kept
+SYNC_RUN_RETENTION_DAYS = env.int('SYNC_RUN_RETENTION_DAYS', default=7)
+
+# Seconds during which a run interrupted before its end is resumed by the next one, skipping its completed tables
+SYNC_RESUME_WINDOW = env.int('SYNC_RESUME_WINDOW', default=6 * 60 * 60)
+
+# Virtual tables rebuilt at the same time, each one on its own PostGIS connection
+VIRTUAL_REBUILD_PARALLELISM = env.int('VIRTUAL_REBUILD_PARALLELISM', default=4)
+
+# Keys of changed rows kept per table to update virtual tables incrementally, beyond it they are rebuilt
+CHANGED_KEYS_LIMIT = env.int('CHANGED_KEYS_LIMIT', default=10000)
+
+# Mirror tables whose schema changes are committed in the same transaction by sync_tables
+SCHEMA_BATCH_SIZE = env.int('SCHEMA_BATCH_SIZE', default=50)
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
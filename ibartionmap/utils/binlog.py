@@ -0,0 +1,162 @@
+import time
+
+from pymysqlreplication import BinLogStreamReader
+from pymysqlreplication.event import XidEvent
+from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+
+from ibartionmap import settings
+from ibartionmap.utils.functions import connect_with_mysql, get_name_table, get_table_key, create_key_index
+from ibartionmap.utils.loaders import get_loader
+from ibartionmap.utils.typemap import get_converters, convert_rows
+
+
+def get_binlog_position(instance):
+    """
+        # Archivo y posición actuales del binlog del servidor de origen
+        :param instance:
+        :return: tuple
+    """
+    connection = connect_with_mysql(instance)
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW MASTER STATUS")
+            status = cursor.fetchone()
+    if not status:
+        raise ValueError("El binlog no está habilitado en el servidor de origen")
+    return status["File"], status["Position"]
+
+
+def get_server_id(instance):
+    # Every connection reads the binlog as a different replica
+    return instance.id.int % (2 ** 31 - 2) + 1
+
+
+class BinlogTable:
+    """
+        # Cambios pendientes de una tabla: la última versión de cada fila por clave, None si se eliminó
+    """
+
+    def __init__(self, instance, options, fields_table):
+        self.instance = instance
+        self.table_origin = options["table"]
+        self.table = get_name_table(instance, self.table_origin)
+        self.fields = [field["Field"] for field in fields_table]
+        self.key = get_table_key(options, fields_table)
+        self.key_type = None
+        self.converters = get_converters({field["Field"]: field["Type"] for field in fields_table})
+        self.pending = {}
+        self.rows = 0
+        self.changed = 0
+        self.deleted = 0
+        self.seconds = 0
+        self.keys = []
+
+    def add(self, values, deleted=False):
+        self.pending[str(values[self.key])] = None if deleted else convert_rows([{
+            field: values.get(field) for field in self.fields
+        }], self.converters)[0]
+
+    def flush(self, connection_on_map):
+        """
+            # Aplica los cambios pendientes sobre la tabla espejo: borra las claves modificadas
+            # y vuelve a cargar la última versión de las filas que siguen existiendo
+        """
+        if not self.pending:
+            return
+        start = time.monotonic()
+        keys = list(self.pending.keys())
+        cursor_on_map = connection_on_map.cursor()
+        if self.key_type is None:
+            self.key_type = create_key_index(cursor_on_map, self.table, self.key)
+        cursor_on_map.execute(
+            "DELETE FROM {0} WHERE {1} = ANY(%s::{2}[])".format(self.table, self.key, self.key_type), (keys,)
+        )
+        rows = [row for row in self.pending.values() if row is not None]
+        loader = get_loader(self.instance, connection_on_map, self.table, self.fields)
+        loader.load([rows])
+        self.rows += len(rows)
+        self.changed += len(rows)
+        self.deleted += len(keys) - len(rows)
+        if self.keys is not None:
+            self.keys += keys
+            if len(self.keys) > settings.CHANGED_KEYS_LIMIT:
+                self.keys = None
+        self.seconds += time.monotonic() - start
+        self.pending = {}
+
+    def stats(self):
+        stats = {
+            "table": self.table,
+            "rows": self.rows,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows / self.seconds, 2) if self.seconds else None,
+            "changed": self.changed,
+            "deleted": self.deleted
+        }
+        if self.keys is not None:
+            stats["key"] = self.key
+            stats["keys"] = self.keys
+        return stats
+
+
+def tail_binlog(instance, connection_on_map, tables, on_position):
+    """
+        # Lee el binlog desde la posición guardada hasta el final y aplica las filas insertadas, actualizadas
+        # o eliminadas en micro-lotes de batch_size filas. La posición se guarda al final de cada transacción
+        # aplicada, para que un reinicio continúe desde ahí
+        :param instance:
+        :param connection_on_map:
+        :param tables: {tabla de origen: BinlogTable}
+        :param on_position: función que recibe el archivo y la posición ya aplicados
+        :return: int
+    """
+    stream = BinLogStreamReader(
+        connection_settings={
+            "host": instance.host,
+            "port": instance.database_port,
+            "user": instance.database_username,
+            "passwd": instance.database_password
+        },
+        server_id=get_server_id(instance),
+        only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, XidEvent],
+        only_schemas=[instance.database_name],
+        only_tables=list(tables.keys()),
+        log_file=instance.binlog_file,
+        log_pos=instance.binlog_position,
+        resume_stream=True,
+        blocking=False
+    )
+    pending = 0
+    events = 0
+    try:
+        for event in stream:
+            if isinstance(event, XidEvent):
+                # Only commits are safe restart points, a rows event needs the table map before it
+                if pending >= instance.batch_size:
+                    for table in tables.values():
+                        table.flush(connection_on_map)
+                    connection_on_map.commit()
+                    on_position(stream.log_file, stream.log_pos)
+                    pending = 0
+                continue
+            table = tables.get(event.table)
+            if table is None:
+                continue
+            for row in event.rows:
+                if isinstance(event, UpdateRowsEvent):
+                    if str(row["before_values"][table.key]) != str(row["after_values"][table.key]):
+                        table.add(row["before_values"], deleted=True)
+                    table.add(row["after_values"])
+                else:
+                    table.add(row["values"], deleted=isinstance(event, DeleteRowsEvent))
+                pending += 1
+                events += 1
+        for table in tables.values():
+            table.flush(connection_on_map)
+        connection_on_map.commit()
+        if stream.log_file:
+            on_position(stream.log_file, stream.log_pos)
+    finally:
+        stream.close()
+    return events
+
@@ -0,0 +1,112 @@
+from ibartionmap.utils.functions import connect_with_mysql, get_table_options, get_table_key
+
+CHANGELOG_TABLE = "ibartionmap_changelog"
+
+SQL_CREATE_CHANGELOG = """
+CREATE TABLE IF NOT EXISTS {0} (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(64) NOT NULL,
+    row_key VARCHAR(255) NOT NULL,
+    KEY {0}_table_name_id (table_name, id)
+) ENGINE=InnoDB
+""".format(CHANGELOG_TABLE)
+
+TRIGGERS = (
+    ("ai", "INSERT", "('{table}', NEW.{key})"),
+    ("au", "UPDATE", "('{table}', OLD.{key}), ('{table}', NEW.{key})"),
+    ("ad", "DELETE", "('{table}', OLD.{key})"),
+)
+
+
+def get_trigger_name(table, suffix):
+    # Trigger names are limited to 64 characters
+    return "ibartionmap_{0}".format(table)[:61] + "_" + suffix
+
+
+def install_triggers(instance, fields_tables):
+    """
+        # Crea la tabla de changelog y los triggers AFTER INSERT/UPDATE/DELETE que guardan en ella la clave
+        # de cada fila modificada de las tablas seleccionadas con la estrategia trigger
+        :param instance:
+        :param fields_tables: {tabla de origen: campos de la tabla}
+        :return: list
+    """
+    from apps.setting.models import Connection
+    result = []
+    connection = connect_with_mysql(instance)
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(SQL_CREATE_CHANGELOG)
+            for table_selected in instance.info_to_sync_selected:
+                options = get_table_options(table_selected)
+                if options.get("strategy") != Connection.TRIGGER:
+                    continue
+                table = options["table"]
+                key = get_table_key(options, fields_tables.get(table) or [])
+                if key is None:
+                    result.append({
+                        "table": table,
+                        "error": "La tabla necesita una clave primaria simple o la opción key"
+                    })
+                    continue
+                try:
+                    for suffix, event, values in TRIGGERS:
+                        name = get_trigger_name(table, suffix)
+                        cursor.execute("DROP TRIGGER IF EXISTS {0}".format(name))
+                        cursor.execute(
+                            "CREATE TRIGGER {0} AFTER {1} ON {2} FOR EACH ROW "
+                            "INSERT INTO {3} (table_name, row_key) VALUES {4}".format(
+                                name, event, table, CHANGELOG_TABLE, values.format(table=table, key=key)
+                            )
+                        )
+                    result.append({"table": table, "key": key})
+                except Exception as e:
+                    result.append({"table": table, "error": e.__str__()})
+    return result
+
+
+def uninstall_triggers(instance):
+    """
+        # Elimina los triggers de todas las tablas seleccionadas y la tabla de changelog
+        :param instance:
+        :return: list
+    """
+    result = []
+    connection = connect_with_mysql(instance)
+    with connection:
+        with connection.cursor() as cursor:
+            for table_selected in instance.info_to_sync_selected:
+                table = get_table_options(table_selected)["table"]
+                for suffix, event, values in TRIGGERS:
+                    cursor.execute("DROP TRIGGER IF EXISTS {0}".format(get_trigger_name(table, suffix)))
+                result.append({"table": table})
+            cursor.execute("DROP TABLE IF EXISTS {0}".format(CHANGELOG_TABLE))
+    return result
+
+
+def read_changelog(connection, table):
+    """
+        # Todas las entradas del changelog para la tabla. No se lee un rango de ids porque una transacción
+        # puede confirmar un id AUTO_INCREMENT menor después de que otra confirmó uno mayor
+        :param connection:
+        :param table:
+        :return: tuple (ids de las entradas leídas, claves distintas de las filas modificadas)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, row_key FROM {0} WHERE table_name = %s".format(CHANGELOG_TABLE), (table,))
+        rows = cursor.fetchall()
+    return [row["id"] for row in rows], list(dict.fromkeys(row["row_key"] for row in rows))
+
+
+def trim_changelog(connection, ids, size=5000):
+    """
+        # Elimina del changelog solo las entradas leídas y ya aplicadas, las que llegaron después quedan
+        # para la próxima ejecución
+        :param connection:
+        :param ids:
+        :param size: ids por sentencia DELETE
+    """
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), size):
+            cursor.execute("DELETE FROM {0} WHERE id IN %s".format(CHANGELOG_TABLE), (ids[start:start + size],))
+    connection.commit()
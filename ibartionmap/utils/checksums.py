@@ -0,0 +1,125 @@
+import math
+
+from ibartionmap.utils.functions import get_name_table, stream_query, create_key_index
+from ibartionmap.utils.loaders import get_loader
+from ibartionmap.utils.typemap import parse_type, is_boolean_type, TEMPORAL_TYPES
+
+# Tipos cuya representación en texto no coincide entre MySQL y la tabla espejo (1e20 y 1e+20)
+SKIP_TYPES = (
+    "float", "double", "real", "binary", "varbinary", "blob", "tinyblob", "mediumblob", "longblob", "json", "bit"
+)
+
+SQL_CHECKSUM_MYSQL = "SELECT COUNT(*) AS total, " \
+                     "COALESCE(SUM(CAST(CONV(SUBSTRING(MD5(CONCAT_WS('#', {0})), 1, 8), 16, 10) AS UNSIGNED)), 0) " \
+                     "AS checksum " \
+                     "FROM {1} WHERE {2} >= %s AND {2} < %s"
+
+SQL_CHECKSUM_PG = "SELECT COUNT(*) AS total, " \
+                  "COALESCE(SUM(('x' || SUBSTR(MD5(CONCAT_WS('#', {0})), 1, 8))::bit(32)::bigint), 0) AS checksum " \
+                  "FROM {1} WHERE {2} >= %s AND {2} < %s"
+
+
+def get_checksum_fields(fields_table):
+    fields_mysql = []
+    fields_pg = []
+    for field in fields_table:
+        type_field, args, unsigned = parse_type(field["Type"])
+        if type_field in SKIP_TYPES:
+            continue
+        if is_boolean_type(type_field, args):
+            fields_mysql.append("{0} <> 0".format(field["Field"]))
+            fields_pg.append("{0}::int::text".format(field["Field"]))
+            continue
+        if type_field in TEMPORAL_TYPES:
+            # Zero dates are stored as NULL in the mirror
+            fields_mysql.append("IF(CAST({0} AS CHAR) LIKE '0000-00-00%', NULL, {0})".format(field["Field"]))
+        else:
+            fields_mysql.append(field["Field"])
+        fields_pg.append("{0}::text".format(field["Field"]))
+    return fields_mysql, fields_pg
+
+
+class RangeChecksum:
+    """
+        # Compara por rangos de clave los checksums de la tabla de origen y su tabla espejo,
+        # subdividiendo solo los rangos que no coinciden hasta llegar a rangos de `leaf_rows` filas
+    """
+
+    def __init__(self, instance, table_origin, fields_table, key, connection, connection_on_map, fanout=16,
+                 leaf_rows=1000):
+        self.instance = instance
+        self.table_origin = table_origin
+        self.table = get_name_table(instance, table_origin)
+        self.fields_table = fields_table
+        self.key = key
+        self.connection = connection
+        self.connection_on_map = connection_on_map
+        self.fanout = fanout
+        self.leaf_rows = leaf_rows
+        self.queries = 0
+        fields_mysql, fields_pg = get_checksum_fields(fields_table)
+        self.sql_mysql = SQL_CHECKSUM_MYSQL.format(", ".join(fields_mysql), table_origin, key)
+        self.sql_pg = SQL_CHECKSUM_PG.format(", ".join(fields_pg), self.table, key)
+
+    def bounds(self):
+        sql = "SELECT MIN({0}) AS min_key, MAX({0}) AS max_key FROM {1}"
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql.format(self.key, self.table_origin))
+            row = cursor.fetchone()
+            keys = [row["min_key"], row["max_key"]]
+        cursor_on_map = self.connection_on_map.cursor()
+        cursor_on_map.execute(sql.format(self.key, self.table))
+        keys += list(cursor_on_map.fetchone())
+        keys = [int(key) for key in keys if key is not None]
+        if not keys:
+            return None
+        return min(keys), max(keys) + 1
+
+    def checksum(self, low, high):
+        self.queries += 1
+        with self.connection.cursor() as cursor:
+            cursor.execute(self.sql_mysql, (low, high))
+            row = cursor.fetchone()
+            source = (int(row["total"]), int(row["checksum"]))
+        cursor_on_map = self.connection_on_map.cursor()
+        cursor_on_map.execute(self.sql_pg, (low, high))
+        total, checksum = cursor_on_map.fetchone()
+        return source, (int(total), int(checksum))
+
+    def compare(self, low, high):
+        source, mirror = self.checksum(low, high)
+        if source == mirror:
+            return []
+        if high - low <= 1 or max(source[0], mirror[0]) <= self.leaf_rows:
+            return [(low, high)]
+        step = math.ceil((high - low) / self.fanout)
+        ranges = []
+        for start in range(low, high, step):
+            ranges += self.compare(start, min(start + step, high))
+        return ranges
+
+    def mismatches(self):
+        # Every range query of the mirror filters on the key, it is committed before the checks that are
+        # rolled back at the end
+        create_key_index(self.connection_on_map.cursor(), self.table, self.key)
+        self.connection_on_map.commit()
+        bounds = self.bounds()
+        if bounds is None:
+            return []
+        return self.compare(*bounds)
+
+    def repair(self, low, high):
+        fields = [field["Field"] for field in self.fields_table]
+        cursor_on_map = self.connection_on_map.cursor()
+        try:
+            cursor_on_map.execute("DELETE FROM {0} WHERE {1} >= %s AND {1} < %s".format(self.table, self.key), (low, high))
+            sql = "SELECT {0} FROM {1} WHERE {2} >= %s AND {2} < %s".format(
+                ", ".join(map(str, fields)), self.table_origin, self.key
+            )
+            loader = get_loader(self.instance, self.connection_on_map, self.table, fields)
+            loader.load(stream_query(self.connection, sql, (low, high), self.instance.batch_size))
+            self.connection_on_map.commit()
+        except Exception:
+            self.connection_on_map.rollback()
+            raise
+        return loader.rows
@@ -0,0 +1,154 @@
+import uuid
+
+import pymysql.cursors
+
+from ibartionmap.utils.functions import connect_with_mysql, connect_with_postgres, stream_query, fetch_in_batches
+from ibartionmap.utils.loaders import PipeCopyLoader
+
+# Same columns and names as SHOW COLUMNS, for every table of the database in a single query
+SQL_MYSQL_COLUMNS = """
+SELECT TABLE_NAME AS `Table`, COLUMN_NAME AS `Field`, COLUMN_TYPE AS `Type`, IS_NULLABLE AS `Null`,
+    COLUMN_KEY AS `Key`, COLUMN_DEFAULT AS `Default`, EXTRA AS `Extra`
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = %s
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+# The same for the tables and views of the current schema of a PostgreSQL database, Type is the
+# format_type name that the mirror keeps. Enums, domains and the rest of the types that aren't built in
+# don't exist in the mirror database, they are kept as text, the text form every column is read with
+SQL_POSTGRES_COLUMNS = """
+SELECT c.relname AS "Table", a.attname AS "Field",
+    CASE WHEN tn.nspname = 'pg_catalog' THEN format_type(a.atttypid, a.atttypmod) ELSE 'text' END AS "Type",
+    CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END AS "Null",
+    CASE WHEN i.indrelid IS NOT NULL THEN 'PRI' ELSE '' END AS "Key",
+    pg_get_expr(d.adbin, d.adrelid) AS "Default", '' AS "Extra"
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+JOIN pg_type t ON t.oid = a.atttypid
+JOIN pg_namespace tn ON tn.oid = t.typnamespace
+LEFT JOIN pg_index i ON i.indrelid = c.oid AND i.indisprimary AND a.attnum = ANY(i.indkey)
+LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p', 'v', 'm')
+ORDER BY c.relname, a.attnum
+"""
+
+
+class SourceConnector:
+    """
+        # Acceso a la base de datos de origen de una conexión: conexión, definición de las tablas
+        # y extracción de sus filas
+    """
+    # Features that read MySQL internals: the binlog, the changelog triggers and the key range
+    # extraction of partitioned and resumable loads
+    supports_binlog = False
+    supports_triggers = False
+    supports_partitions = False
+    # The column types of the source are PostgreSQL types the mirror keeps, instead of MySQL ones to map
+    native_types = False
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    def connect(self, stream=False, wait=True):
+        """
+            # Conexión con la base de datos de origen, sin wait no espera un puesto de conexión libre
+            :return: connection
+        """
+        raise NotImplementedError
+
+    def read_columns(self, cursor):
+        raise NotImplementedError
+
+    def get_source_tables(self):
+        """
+            # Campos de todas las tablas de la base de datos de origen con el formato de SHOW COLUMNS
+            :return: dict {tabla de origen: campos}
+        """
+        connection = self.connect()
+        with connection:
+            with connection.cursor() as cursor:
+                tables = {}
+                for row in self.read_columns(cursor):
+                    row = dict(row)
+                    table = row.pop("Table")
+                    tables.setdefault(table, []).append(row)
+        return tables
+
+    def get_select(self, table, fields):
+        return "SELECT " + ", ".join(map(str, fields)) + " FROM " + table
+
+    def stream_query(self, connection, sql, params=None, size=5000):
+        return stream_query(connection, sql, params, size)
+
+    def copy_table(self, connection, connection_on_map, table_origin, table, fields):
+        """
+            # Carga completa de la tabla sin pasar las filas por Python, o None si el origen no lo permite
+            :return: Loader
+        """
+        return None
+
+
+class MySQLConnector(SourceConnector):
+    supports_binlog = True
+    supports_triggers = True
+    supports_partitions = True
+
+    def connect(self, stream=False, wait=True):
+        # The server side cursor streams the rows instead of buffering the whole table
+        return connect_with_mysql(
+            self.instance, pymysql.cursors.SSDictCursor if stream else pymysql.cursors.DictCursor, wait=wait
+        )
+
+    def read_columns(self, cursor):
+        cursor.execute(SQL_MYSQL_COLUMNS, (self.instance.database_name,))
+        return cursor.fetchall()
+
+
+class PostgreSQLConnector(SourceConnector):
+    native_types = True
+
+    def connect(self, stream=False, wait=True):
+        return connect_with_postgres(self.instance, wait)
+
+    def read_columns(self, cursor):
+        cursor.execute(SQL_POSTGRES_COLUMNS)
+        return cursor.fetchall()
+
+    def get_select(self, table, fields):
+        # The text form of every value is what COPY and INSERT load into the mirror's column of the same type
+        return "SELECT " + ", ".join("{0}::text AS {0}".format(field) for field in fields) + " FROM " + table
+
+    def stream_query(self, connection, sql, params=None, size=5000):
+        # A named cursor keeps the result on the server and sends it in batches
+        with connection.cursor(name="ibartionmap_{0}".format(uuid.uuid4().hex)) as cursor:
+            cursor.itersize = size
+            cursor.execute(sql, params)
+            yield from fetch_in_batches(cursor, size)
+
+    def copy_table(self, connection, connection_on_map, table_origin, table, fields):
+        if self.instance.max_rows_per_second or self.instance.max_bytes_per_second or self.instance.batch_pause:
+            # The throttle is applied per batch of rows, that the pipe doesn't see
+            return None
+        loader = PipeCopyLoader(connection_on_map, table, fields)
+        # COPY writes the text form itself, the plain select is enough
+        sql = super(PostgreSQLConnector, self).get_select(table_origin, fields)
+        loader.copy(connection, "COPY ({0}) TO STDOUT".format(sql))
+        return loader
+
+
+def get_connector(instance):
+    """
+        # Conector de la base de datos de origen de la conexión
+        :param instance:
+        :return: SourceConnector
+    """
+    from apps.setting.models import Connection
+    connectors = {
+        Connection.MySQL: MySQLConnector,
+        Connection.PostgreSQL: PostgreSQLConnector,
+    }
+    if instance.database_origin not in connectors:
+        raise ValueError("Base de datos de origen no soportada: {0}".format(instance.database_origin))
+    return connectors[instance.database_origin](instance)
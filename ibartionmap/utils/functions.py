@@ -1,17 +1,23 @@
 import datetime
+import hashlib
 import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from decimal import Decimal
 from json import JSONEncoder
 from uuid import UUID
 
 import psycopg2
 import pymysql.cursors
+from psycopg2.extras import RealDictCursor
 from constance import config
 from constance.backends.database.models import Constance
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import QuerySet
 
 from ibartionmap import settings
+from ibartionmap.utils.typemap import get_pg_type, get_pg_column, get_cursor_converters, convert_rows
 import environ
 
 env = environ.Env(
@@ -208,43 +214,143 @@ def format_headers_import(headers, add_info=None):
     return headers
 
 
-def connect_with_mysql(instance):
-    connection = pymysql.connect(
-        host=instance.host,
-        user=instance.database_username,
-        password=instance.database_password,
-        database=instance.database_name,
-        port=instance.database_port,
-        cursorclass=pymysql.cursors.DictCursor
-    )
+class SourceConnection(pymysql.connections.Connection):
+    """
+        # Conexión de origen que lleva el límite de extracción de la conexión
+        # y libera su puesto de conexiones simultáneas al cerrarse
+    """
+    slot = None
+    throttle = None
+
+    def release_slot(self):
+        if self.slot is not None:
+            self.slot.release()
+
+    def close(self):
+        try:
+            super(SourceConnection, self).close()
+        finally:
+            self.release_slot()
+
+    def _force_close(self):
+        try:
+            super(SourceConnection, self)._force_close()
+        finally:
+            self.release_slot()
+
+
+def connect_with_mysql(instance, cursorclass=pymysql.cursors.DictCursor, slot=None, wait=True):
+    from ibartionmap.utils.throttle import acquire_source_slot, get_throttle
+
+    if slot is None:
+        slot = acquire_source_slot(instance, wait)
+    try:
+        connection = SourceConnection(
+            host=instance.host,
+            user=instance.database_username,
+            password=instance.database_password,
+            database=instance.database_name,
+            port=instance.database_port,
+            cursorclass=cursorclass
+        )
+    except Exception:
+        if slot is not None:
+            slot.release()
+        raise
+    connection.slot = slot
+    connection.throttle = get_throttle(instance)
     return connection
 
 
+class PostgresSourceConnection(psycopg2.extensions.connection):
+    """
+        # Conexión de origen PostgreSQL con el mismo límite de extracción y puesto de conexiones
+        # que SourceConnection. Como pymysql, al salir del bloque with se cierra la conexión
+    """
+    slot = None
+    throttle = None
+
+    def release_slot(self):
+        if self.slot is not None:
+            self.slot.release()
+            self.slot = None
+
+    def close(self):
+        try:
+            super(PostgresSourceConnection, self).close()
+        finally:
+            self.release_slot()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            super(PostgresSourceConnection, self).__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.close()
+
+
+def connect_with_postgres(instance, wait=True):
+    from ibartionmap.utils.throttle import acquire_source_slot, get_throttle
+
+    slot = acquire_source_slot(instance, wait)
+    try:
+        connection = psycopg2.connect(
+            host=instance.host,
+            user=instance.database_username,
+            password=instance.database_password,
+            database=instance.database_name,
+            port=instance.database_port,
+            connection_factory=PostgresSourceConnection,
+            cursor_factory=RealDictCursor
+        )
+    except Exception:
+        if slot is not None:
+            slot.release()
+        raise
+    connection.slot = slot
+    connection.throttle = get_throttle(instance)
+    return connection
+
+
+def fetch_in_batches(cursor, size):
+    """
+        # Recorre el resultado de un cursor en lotes de `size` filas
+        :param cursor:
+        :param size:
+        :return: generator
+    """
+    throttle = getattr(cursor.connection, 'throttle', None)
+    # Values read from MySQL are converted to what the native PostgreSQL type of the mirror column expects
+    converters = get_cursor_converters(cursor) if isinstance(cursor, pymysql.cursors.Cursor) else None
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield convert_rows(rows, converters)
+        if throttle is not None:
+            throttle.wait(rows)
+
+
+def stream_query(connection, sql, params=None, size=5000):
+    """
+        # Ejecuta la consulta al empezar a consumir el generador y devuelve sus filas en lotes
+        :param connection:
+        :param sql:
+        :param params:
+        :param size:
+        :return: generator
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        yield from fetch_in_batches(cursor, size)
+
+
 def get_tipo_mysql_to_pg(typeField):
     """
         # Definir el tipo de dato de mysql a posgresql
         :param typeField:
         :return: str
     """
-    if typeField.startswith("int") or typeField.startswith("tinyint"):
-        return "integer"
-    elif typeField.startswith("bigint"):
-        return "bigint"
-    elif typeField.startswith("datetime") or typeField.startswith("date"):
-        return "varchar(30)"
-        # return "timestamp without time zone"
-    elif typeField.startswith("float") or typeField.startswith("double"):
-        return "double precision"
-    elif typeField.startswith("varbinary"):
-        if typeField == "varbinary(0)":
-            return "bit"
-        return typeField.replace("varbinary", "bit")
-    elif typeField.startswith("binary"):
-        if typeField == "binary(0)":
-            return "bit"
-        return typeField.replace("binary", "bit")
-    else:
-        return typeField
+    return get_pg_type(typeField)
 
 
 def connect_with_on_map():
@@ -262,14 +368,57 @@ def get_name_table(connection, table_name):
     return "{0}_{1}".format(connection.database_name, table_name)
 
 
+def get_table_options(table_selected):
+    """
+        # Las entradas de info_to_sync_selected pueden ser el nombre de la tabla o un objeto
+        # con la tabla y sus opciones de sincronización (strategy, key, watermark)
+        :param table_selected:
+        :return: dict
+    """
+    if isinstance(table_selected, dict):
+        return table_selected
+    return {"table": table_selected}
+
+
+def get_tables_selected(connection):
+    return [get_table_options(table_selected)["table"] for table_selected in connection.info_to_sync_selected]
+
+
+def get_table_key(options, fields_table):
+    """
+        # Columna clave de la tabla: la indicada en las opciones o la clave primaria simple de origen
+        :param options:
+        :param fields_table:
+        :return: str
+    """
+    if options.get("key"):
+        return options["key"]
+    keys = [field["Field"] for field in fields_table if field.get("Key") == "PRI"]
+    return keys[0] if len(keys) == 1 else None
+
+
+def is_integer_type(type_field):
+    return type_field.split("(")[0].split(" ")[0].lower() in (
+        "tinyint", "smallint", "mediumint", "int", "integer", "bigint", "serial", "bigserial"
+    )
+
+
 def formatter_field(field):
-    print(field)
     if field is None:
         return "NULL"
-    elif field == "0000-00-00":
-        return "''"
     else:
-        return "'{0}'".format(field)
+        return "'{0}'".format(str(field).replace("'", "''"))
+
+
+def formatter_copy_field(field):
+    """
+        # Formatea un valor para el formato texto de COPY ... FROM STDIN
+        :param field:
+        :return: str
+    """
+    if field is None:
+        return "\\N"
+    return str(field).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
 
 
 def generate_virtual_sql(data, limit=None):
@@ -338,34 +487,423 @@ def generate_virtual_sql(data, limit=None):
         }
 
 
+SIMPLE_JOIN_SQL = re.compile(
+    r"^SELECT \w+\.\w+ AS \w+(, \w+\.\w+ AS \w+)* FROM \w+(, \w+)*"
+    r"( WHERE \w+\.\w+ = \w+\.\w+( AND \w+\.\w+ = \w+\.\w+)*)?\s*$"
+)
+
+
+def get_virtual_sources(instance):
+    """
+        # Tablas que lee una tabla virtual, según sus tablas y relaciones. La relación `tables`
+        # es simétrica, por eso una tabla virtual solo cuenta como origen si su nombre aparece en el sql
+        :param instance:
+        :return: dict
+    """
+    candidates = list(instance.tables.all())
+    for relation in instance.relations.all():
+        candidates += [relation.table_one, relation.table_two]
+    return {
+        table.id: table for table in candidates
+        if table.id != instance.id and (
+            not table.is_virtual or re.search(r"\b{0}\b".format(re.escape(table.table)), instance.sql or "")
+        )
+    }
+
+
+def get_virtual_dependencies(instance):
+    """
+        # Ids de las tablas que lee una tabla virtual
+        :param instance:
+        :return: set
+    """
+    return set(get_virtual_sources(instance).keys())
+
+
+def get_dependent_virtual_tables(tables_ids):
+    """
+        # Tablas virtuales activas que dependen, directa o transitivamente, de las tablas indicadas
+        :param tables_ids:
+        :return: list
+    """
+    from apps.core.models import SynchronizedTables
+    virtual_tables = list(SynchronizedTables.objects.filter(is_virtual=True, is_active=True).prefetch_related(
+        'tables', 'relations__table_one', 'relations__table_two'
+    ))
+    dependencies = {table.id: get_virtual_dependencies(table) for table in virtual_tables}
+    changed = {UUID(str(table_id)) for table_id in tables_ids}
+    result = []
+    pending = True
+    while pending:
+        pending = False
+        for table in virtual_tables:
+            if table.id not in changed and dependencies[table.id] & changed:
+                changed.add(table.id)
+                result.append(table)
+                pending = True
+    return result
+
+
+def get_column_type(cursor_on_map, table, column):
+    cursor_on_map.execute(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = %s",
+        (table, column.lower())
+    )
+    return cursor_on_map.fetchone()[0]
+
+
+def create_key_index(cursor_on_map, table, key):
+    """
+        # Crea el índice único de la clave en la tabla espejo, como load_upsert, para que los cambios por
+        # clave no recorran toda la tabla
+        :param cursor_on_map:
+        :param table:
+        :param key:
+        :return: str, tipo de la columna clave, las claves se comparan como un arreglo de ese tipo sin convertir
+        la columna y así usan el índice
+    """
+    cursor_on_map.execute("CREATE UNIQUE INDEX IF NOT EXISTS {0}_{1}_key ON {0} ({1})".format(table, key))
+    return get_column_type(cursor_on_map, table, key)
+
+
+def update_table_virtual(instance, changes):
+    """
+        # Mantiene de forma incremental una tabla virtual que es un join por igualdad: borra y vuelve a calcular
+        # solo las filas de las claves que cambiaron en sus tablas de origen. Devuelve None si la tabla
+        # debe reconstruirse completa
+        :param instance:
+        :param changes: {id tabla: {"key": columna, "keys": [claves]} o None si no se conocen las claves}
+        :return: dict
+    """
+    from apps.core.models import SynchronizedTables
+    if not instance.incremental or instance.storage != SynchronizedTables.TABLE or \
+            not SIMPLE_JOIN_SQL.match(instance.sql or ""):
+        return None
+    updates = []
+    for table_id, table in get_virtual_sources(instance).items():
+        if table_id not in changes:
+            continue
+        change = changes[table_id]
+        if not change:
+            return None
+        # The key of the source table has to be a column of the virtual table
+        alias = next((
+            field["alias"] for field in instance.fields
+            if str(field.get("table")) == str(table_id) and field.get("Field") == change["key"]
+        ), None)
+        if alias is None:
+            return None
+        updates.append((table, alias, change))
+    if not updates:
+        return None
+
+    connection_on_map = connect_with_on_map()
+    sql = ""
+    fields_table = [field["alias"] for field in instance.fields]
+    rows = 0
+    try:
+        cursor_on_map = connection_on_map.cursor()
+        for table, alias, change in updates:
+            # Both tables are filtered on the uncast key against an array of its type, so they use their index
+            cursor_on_map.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_{1}_idx ON {0} ({1})".format(instance.table, alias)
+            )
+            sql = "DELETE FROM {0} WHERE {1} = ANY(%s::{2}[])".format(
+                instance.table, alias, get_column_type(cursor_on_map, instance.table, alias)
+            )
+            cursor_on_map.execute(sql, (change["keys"],))
+            rows += cursor_on_map.rowcount
+            key_type = create_key_index(cursor_on_map, table.table, change["key"])
+            sql = "INSERT INTO {0} ({1}) {2} {3} {4}.{5} = ANY(%s::{6}[])".format(
+                instance.table,
+                ", ".join(map(str, fields_table)),
+                instance.sql.strip(),
+                "AND" if " WHERE " in instance.sql else "WHERE",
+                table.table,
+                change["key"],
+                key_type
+            )
+            cursor_on_map.execute(sql, (change["keys"],))
+            rows += cursor_on_map.rowcount
+        connection_on_map.commit()
+        return {
+            "sql": sql,
+            "fields_table": fields_table,
+            "incremental": True,
+            "rows": rows
+        }
+    except Exception as e:
+        connection_on_map.rollback()
+        return {
+            "sql": sql,
+            "fields_table": fields_table,
+            "error": e.__str__()
+        }
+    finally:
+        connection_on_map.close()
+
+
+def refresh_table_virtual(instance, changes=None):
+    """
+        # Actualiza la tabla virtual de forma incremental cuando es posible, si no la reconstruye completa
+        :param instance:
+        :param changes:
+        :return: dict
+    """
+    start = time.monotonic()
+    stats = update_table_virtual(instance, changes) if changes else None
+    if stats is None or stats.get("error"):
+        stats = create_table_virtual(instance)
+    stats["seconds"] = round(time.monotonic() - start, 3)
+    return stats
+
+
+def rebuild_virtual_tables(tables, parallelism=None, changes=None):
+    """
+        # Reconstruye las tablas virtuales en orden topológico. Las independientes se reconstruyen en paralelo,
+        # cada una en su propia conexión, y las dependientes esperan solo a las tablas que leen
+        :param tables:
+        :param parallelism:
+        :param changes: claves que cambiaron por tabla de origen, para actualizar de forma incremental
+        :return: list
+    """
+    parallelism = parallelism or settings.VIRTUAL_REBUILD_PARALLELISM
+    changes = dict(changes or {})
+    tables = {table.id: table for table in tables}
+    predecessors = {
+        table.id: get_virtual_dependencies(table) & set(tables.keys()) for table in tables.values()
+    }
+    successors = {table_id: set() for table_id in tables.keys()}
+    for table_id, dependencies in predecessors.items():
+        for dependency in dependencies:
+            successors[dependency].add(table_id)
+
+    result = []
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        while predecessors or running:
+            ready = [table_id for table_id, dependencies in predecessors.items() if not dependencies]
+            if not ready and not running:
+                # A cycle between virtual tables, the remaining ones are rebuilt without order
+                cycle = [tables[table_id].table for table_id in predecessors.keys()]
+                result += [
+                    {"table": table, "error": "Dependencia circular entre tablas virtuales: " + ", ".join(cycle)}
+                    for table in cycle
+                ]
+                ready = list(predecessors.keys())
+            for table_id in ready:
+                del predecessors[table_id]
+                running[executor.submit(refresh_table_virtual, tables[table_id], changes)] = table_id
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                table_id = running.pop(future)
+                stats = future.result()
+                stats["table"] = tables[table_id].table
+                result.append(stats)
+                # Its changed keys are unknown to the tables built on top of it
+                changes[table_id] = None
+                if not stats.get("error"):
+                    for successor in successors[table_id]:
+                        if successor in predecessors:
+                            predecessors[successor].discard(table_id)
+                    continue
+                # Nothing to build on, the tables that depend on it are not rebuilt
+                pending = [(successor, table_id) for successor in successors[table_id]]
+                while pending:
+                    successor, origin = pending.pop()
+                    if successor in predecessors:
+                        del predecessors[successor]
+                        result.append({
+                            "table": tables[successor].table,
+                            "error": "No se reconstruyó la tabla {0}".format(tables[origin].table)
+                        })
+                        pending += [(table, successor) for table in successors[successor]]
+    return result
+
+
+def get_relation(cursor, table):
+    """
+        # Tipo (r: tabla, m: vista materializada) y comentario de una relación de PostGIS
+        :param cursor:
+        :param table:
+        :return: tuple
+    """
+    cursor.execute(
+        "SELECT relkind, obj_description(oid, 'pg_class') FROM pg_class WHERE oid = to_regclass(%s)", (table,)
+    )
+    return cursor.fetchone() or (None, None)
+
+
+def drop_relation(cursor, table):
+    """
+        # Elimina la tabla o vista materializada, junto con las vistas que dependan de ella. Quien la vuelve
+        # a crear restaura esas vistas con get_dependent_views y restore_views antes de confirmar
+        :param cursor:
+        :param table:
+        :return: str
+    """
+    kind, _ = get_relation(cursor, table)
+    sql = ""
+    if kind:
+        sql = "DROP {0} {1} CASCADE".format("MATERIALIZED VIEW" if kind == 'm' else "TABLE", table)
+        cursor.execute(sql)
+    return sql
+
+
+SQL_DEPENDENT_VIEWS = """
+WITH RECURSIVE dependents AS (
+    SELECT r.ev_class AS oid, 1 AS level
+    FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid AND d.classid = 'pg_rewrite'::regclass
+    WHERE d.refobjid = to_regclass(%s) AND r.ev_class <> d.refobjid
+    UNION
+    SELECT r.ev_class, dependents.level + 1
+    FROM dependents
+    JOIN pg_depend d ON d.refobjid = dependents.oid
+    JOIN pg_rewrite r ON r.oid = d.objid AND d.classid = 'pg_rewrite'::regclass
+    WHERE r.ev_class <> d.refobjid
+)
+SELECT c.relname, c.relkind, pg_get_viewdef(c.oid), obj_description(c.oid, 'pg_class'),
+    ARRAY(SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i WHERE i.indrelid = c.oid), MAX(dependents.level)
+FROM dependents JOIN pg_class c ON c.oid = dependents.oid
+GROUP BY c.oid, c.relname, c.relkind
+ORDER BY MAX(dependents.level)
+"""
+
+
+def get_dependent_views(cursor, table):
+    """
+        # Vistas y vistas materializadas que dependen de la tabla, directa o indirectamente, con lo necesario
+        # para volver a crearlas después de un DROP ... CASCADE. Se leen antes de renombrar la tabla, porque
+        # su definición usa el nombre actual
+        :param cursor:
+        :param table:
+        :return: list
+    """
+    cursor.execute(SQL_DEPENDENT_VIEWS, (table,))
+    return [
+        {"name": name, "kind": kind, "definition": definition, "comment": comment, "indexes": indexes}
+        for name, kind, definition, comment, indexes, level in cursor.fetchall()
+    ]
+
+
+def restore_views(cursor, views):
+    """
+        # Vuelve a crear, en la misma transacción que las eliminó, las vistas de get_dependent_views. Una vista
+        # que ya no es válida, por ejemplo porque usaba una columna eliminada, se omite y se devuelve
+        :param cursor:
+        :param views:
+        :return: list de vistas que no se pudieron crear
+    """
+    failed = []
+    for view in views:
+        # A failed view only undoes its own statements
+        cursor.execute("SAVEPOINT restore_view")
+        try:
+            kind = "MATERIALIZED VIEW" if view["kind"] == 'm' else "VIEW"
+            cursor.execute("CREATE {0} {1} AS {2}".format(kind, view["name"], view["definition"].rstrip().rstrip(";")))
+            for index_def in view["indexes"]:
+                cursor.execute(index_def)
+            if view["comment"] is not None:
+                cursor.execute("COMMENT ON {0} {1} IS %s".format(kind, view["name"]), (view["comment"],))
+            cursor.execute("RELEASE SAVEPOINT restore_view")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT restore_view")
+            failed.append({"table": view["name"], "error": e.__str__()})
+    return failed
+
+
+def create_materialized_view(instance):
+    """
+        # Guarda la tabla virtual como vista materializada. Si la consulta no cambió se refresca con
+        # REFRESH MATERIALIZED VIEW CONCURRENTLY, que no bloquea las lecturas, usando el índice único de unique_fields
+        :param instance:
+        :return: dict
+    """
+    connection_on_map = connect_with_on_map()
+    sql = ""
+    fields_table = [field["alias"] for field in instance.fields]
+    # The comment of the view keeps the query it was created with
+    signature = hashlib.md5("{0}|{1}".format(instance.sql, instance.unique_fields).encode()).hexdigest()
+    try:
+        cursor_on_map = connection_on_map.cursor()
+        kind, comment = get_relation(cursor_on_map, instance.table)
+        if kind == 'm' and comment == signature:
+            sql = "REFRESH MATERIALIZED VIEW {0}{1}".format(
+                "CONCURRENTLY " if instance.unique_fields else "", instance.table
+            )
+            cursor_on_map.execute(sql)
+        else:
+            views = get_dependent_views(cursor_on_map, instance.table)
+            drop_relation(cursor_on_map, instance.table)
+            sql = "CREATE MATERIALIZED VIEW {0} AS {1}".format(instance.table, instance.sql)
+            cursor_on_map.execute(sql)
+            if instance.unique_fields:
+                cursor_on_map.execute("CREATE UNIQUE INDEX {0}_unique ON {0} ({1})".format(
+                    instance.table, ", ".join(instance.unique_fields)
+                ))
+            cursor_on_map.execute("COMMENT ON MATERIALIZED VIEW {0} IS %s".format(instance.table), (signature,))
+            # The views built on top are back before the commit, readers never miss them
+            restore_views(cursor_on_map, views)
+        connection_on_map.commit()
+        return {
+            "sql": sql,
+            "fields_table": fields_table
+        }
+    except Exception as e:
+        connection_on_map.rollback()
+        return {
+            "sql": sql,
+            "fields_table": fields_table,
+            "error": e.__str__()
+        }
+    finally:
+        connection_on_map.close()
+
+
 def create_table_virtual(instance):
+    from apps.core.models import SynchronizedTables
+    from ibartionmap.utils.connectors import get_connector
+    if instance.storage == SynchronizedTables.MATERIALIZED_VIEW:
+        return create_materialized_view(instance)
     connection_on_map = connect_with_on_map()
     sql = ""
     fields_table = []
     try:
         cursor_on_map = connection_on_map.cursor()
-        sql = "DROP TABLE IF EXISTS {0}".format(instance.table)
-        cursor_on_map.execute(sql)
-        connection_on_map.commit()
+        # The table is dropped, created and filled in a single transaction, readers keep seeing the previous
+        # rows until the commit and the views built on top are restored before it
+        views = get_dependent_views(cursor_on_map, instance.table)
+        sql = drop_relation(cursor_on_map, instance.table)
+        # Each field keeps the type mapping of the origin of the table it comes from
+        origins = {
+            str(table.id): table.connection for table in SynchronizedTables.objects.filter(
+                id__in=[field.get("table") for field in instance.fields if field.get("table")]
+            ).select_related('connection')
+        }
         fields_create = []
         for field in instance.fields:
-            char_null = "NOT NULL" if field.get("Null") == "NO" else ""
-            char_type = get_tipo_mysql_to_pg(field["Type"])
-            fields_create.append(
-                "{0} {1} {2}".format(field["alias"], char_type, char_null)
-            )
+            connection = origins.get(str(field.get("table")))
+            native = connection is not None and get_connector(connection).native_types
+            fields_create.append(get_pg_column(field["alias"], field, native))
             fields_table.append(
                 "{0}".format(field["alias"])
             )
         sql = "CREATE TABLE {0} ({1});".format(instance.table, ", ".join(map(str, fields_create)))
         cursor_on_map.execute(sql)
-        connection_on_map.commit()
         sql = "INSERT INTO {0} ({1}) {2}".format(
             instance.table,
             ", ".join(map(str, fields_table)),
             instance.sql
         )
         cursor_on_map.execute(sql)
+        if instance.incremental:
+            # The incremental refresh deletes by the keys of the source tables
+            for field in instance.fields:
+                if field.get("Key") == "PRI":
+                    cursor_on_map.execute(
+                        "CREATE INDEX IF NOT EXISTS {0}_{1}_idx ON {0} ({1})".format(instance.table, field["alias"])
+                    )
+        restore_views(cursor_on_map, views)
         connection_on_map.commit()
         connection_on_map.close()
         return {
@@ -373,6 +911,7 @@ def create_table_virtual(instance):
             "fields_table": fields_table
         }
     except Exception as e:
+        connection_on_map.close()
         return {
             "sql": sql,
             "fields_table": fields_table,
@@ -0,0 +1,522 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql.cursors
+
+from ibartionmap import settings
+from ibartionmap.utils.functions import formatter_field, formatter_copy_field, connect_with_mysql, \
+    connect_with_on_map, stream_query, get_dependent_views, restore_views, create_key_index
+from ibartionmap.utils.throttle import try_acquire_source_slots
+
+
+class IteratorFile:
+    """
+        # Objeto tipo archivo que alimenta COPY ... FROM STDIN desde un generador de lineas
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ""
+        self.position = 0
+
+    def read(self, size=-1):
+        # The buffer is consumed by position so a large chunk is not copied on every read
+        while size < 0 or len(self.buffer) - self.position < size:
+            try:
+                chunk = next(self.lines)
+            except StopIteration:
+                break
+            self.buffer = self.buffer[self.position:] + chunk
+            self.position = 0
+        end = len(self.buffer) if size < 0 else min(self.position + size, len(self.buffer))
+        data = self.buffer[self.position:end]
+        self.position = end
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+class Loader:
+    def __init__(self, connection_on_map, table, fields):
+        self.connection_on_map = connection_on_map
+        self.table = table
+        self.fields = fields
+        self.rows = 0
+        self.seconds = 0
+        self.extract_seconds = 0
+        self.transform_seconds = 0
+        self.bytes = 0
+        self.changed = None
+        self.deleted = None
+        self.key = None
+        self.keys = None
+
+    def extract(self, batches):
+        """
+            # Recorre los lotes midiendo el tiempo que se espera al origen
+        """
+        batches = iter(batches)
+        while True:
+            start = time.monotonic()
+            try:
+                rows = next(batches)
+            except StopIteration:
+                return
+            finally:
+                self.extract_seconds += time.monotonic() - start
+            yield rows
+
+    def load(self, batches):
+        start = time.monotonic()
+        try:
+            self.write(self.extract(batches))
+        finally:
+            self.seconds += time.monotonic() - start
+        return self.rows
+
+    def write(self, batches):
+        raise NotImplementedError
+
+    def merge(self, loader):
+        self.rows += loader.rows
+        self.extract_seconds += loader.extract_seconds
+        self.transform_seconds += loader.transform_seconds
+        self.bytes += loader.bytes
+
+    def stats(self):
+        stats = {
+            "table": self.table,
+            "rows": self.rows,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows / self.seconds, 2) if self.seconds else None,
+            "extract_seconds": round(self.extract_seconds, 3),
+            "transform_seconds": round(self.transform_seconds, 3),
+            "load_seconds": round(max(self.seconds - self.extract_seconds - self.transform_seconds, 0), 3),
+            "bytes": self.bytes
+        }
+        if self.changed is not None:
+            stats["changed"] = self.changed
+        if self.deleted is not None:
+            stats["deleted"] = self.deleted
+        if self.keys is not None:
+            stats["key"] = self.key
+            stats["keys"] = self.keys
+        return stats
+
+
+class InsertLoader(Loader):
+    def write(self, batches):
+        cursor_on_map = self.connection_on_map.cursor()
+        for rows in batches:
+            start = time.monotonic()
+            sql = "INSERT INTO {0} ({1}) VALUES".format(self.table, ", ".join(map(str, self.fields)))
+            records = [" ({0})".format(", ".join(map(formatter_field, row.values()))) for row in rows]
+            sql += ", ".join(map(str, records))
+            self.transform_seconds += time.monotonic() - start
+            self.bytes += len(sql)
+            cursor_on_map.execute(sql)
+            self.rows += len(rows)
+
+
+class CopyLoader(Loader):
+    def format_row(self, row):
+        return "\t".join(map(formatter_copy_field, row.values())) + "\n"
+
+    def lines(self, batches):
+        # Every batch is formatted at once and handed to COPY as a single chunk
+        for rows in batches:
+            start = time.monotonic()
+            chunk = "".join(map(self.format_row, rows))
+            self.transform_seconds += time.monotonic() - start
+            self.rows += len(rows)
+            self.bytes += len(chunk)
+            yield chunk
+
+    def write(self, batches):
+        cursor_on_map = self.connection_on_map.cursor()
+        sql = "COPY {0} ({1}) FROM STDIN".format(self.table, ", ".join(map(str, self.fields)))
+        cursor_on_map.copy_expert(sql, IteratorFile(self.lines(batches)))
+
+
+class HashCopyLoader(CopyLoader):
+    """
+        # COPY que agrega a cada fila el hash md5 de su contenido en la columna row_hash
+    """
+
+    def format_row(self, row):
+        line = super(HashCopyLoader, self).format_row(row)
+        return line[:-1] + "\t" + hashlib.md5(line.encode()).hexdigest() + "\n"
+
+    def write(self, batches):
+        cursor_on_map = self.connection_on_map.cursor()
+        sql = "COPY {0} ({1}, row_hash) FROM STDIN".format(self.table, ", ".join(map(str, self.fields)))
+        cursor_on_map.copy_expert(sql, IteratorFile(self.lines(batches)))
+
+
+class PipeReader:
+    """
+        # Extremo de lectura de la tubería entre los dos COPY, mide los bytes y la espera al origen
+    """
+
+    def __init__(self, file, loader):
+        self.file = file
+        self.loader = loader
+
+    def read(self, size=-1):
+        start = time.monotonic()
+        data = self.file.read(size)
+        self.loader.extract_seconds += time.monotonic() - start
+        self.loader.bytes += len(data)
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+class PipeCopyLoader(Loader):
+    """
+        # COPY FROM STDIN alimentado directamente por el COPY TO STDOUT de un origen PostgreSQL,
+        # las filas no pasan por Python
+    """
+
+    def copy(self, connection, sql):
+        start = time.monotonic()
+        read_fd, write_fd = os.pipe()
+        reader = PipeReader(os.fdopen(read_fd, 'rb'), self)
+        writer = os.fdopen(write_fd, 'wb')
+        errors = []
+
+        def extract():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(sql, writer)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                try:
+                    writer.close()
+                except OSError:
+                    # The mirror side already failed and closed the pipe
+                    pass
+
+        thread = threading.Thread(target=extract)
+        thread.start()
+        try:
+            cursor_on_map = self.connection_on_map.cursor()
+            cursor_on_map.copy_expert(
+                "COPY {0} ({1}) FROM STDIN".format(self.table, ", ".join(map(str, self.fields))), reader
+            )
+            self.rows = max(cursor_on_map.rowcount, 0)
+        finally:
+            reader.close()
+            thread.join()
+            self.seconds += time.monotonic() - start
+        # A source error ends the pipe early, the partial load is rolled back by the caller
+        if errors:
+            raise errors[0]
+        return self.rows
+
+
+LOADERS = {
+    'INSERT': InsertLoader,
+    'COPY': CopyLoader,
+}
+
+
+def get_loader(instance, connection_on_map, table, fields):
+    return LOADERS.get(instance.loader, CopyLoader)(connection_on_map, table, fields)
+
+
+def fetch_keys(cursor):
+    """
+        # Claves devueltas por RETURNING, o None si superan CHANGED_KEYS_LIMIT
+    """
+    keys = cursor.fetchmany(settings.CHANGED_KEYS_LIMIT + 1)
+    if len(keys) > settings.CHANGED_KEYS_LIMIT:
+        return None
+    return [row[0] for row in keys]
+
+
+def get_upsert_action(table, fields, key):
+    """
+        # Acción de ON CONFLICT que solo reescribe las filas cuyo contenido cambió
+    """
+    fields = [field for field in fields if field != key]
+    if not fields:
+        return "NOTHING"
+    return "UPDATE SET {0} WHERE ROW({1}) IS DISTINCT FROM ROW({2})".format(
+        ", ".join(["{0} = EXCLUDED.{0}".format(field) for field in fields]),
+        ", ".join(["{0}.{1}".format(table, field) for field in fields]),
+        ", ".join(["EXCLUDED.{0}".format(field) for field in fields])
+    )
+
+
+def load_upsert(instance, connection_on_map, table, fields, key, batches):
+    """
+        # Carga las filas en una tabla temporal y las aplica sobre la tabla espejo con INSERT ... ON CONFLICT
+    """
+    cursor_on_map = connection_on_map.cursor()
+    cursor_on_map.execute("CREATE UNIQUE INDEX IF NOT EXISTS {0}_{1}_key ON {0} ({1})".format(table, key))
+    delta = "{0}__delta".format(table)
+    cursor_on_map.execute("CREATE TEMP TABLE {0} (LIKE {1} INCLUDING DEFAULTS)".format(delta, table))
+    loader = get_loader(instance, connection_on_map, delta, fields)
+    loader.load(batches)
+    start = time.monotonic()
+    sql = "INSERT INTO {0} ({1}) SELECT {1} FROM {2} ON CONFLICT ({3}) DO {4} RETURNING {3}::text".format(
+        table,
+        ", ".join(map(str, fields)),
+        delta,
+        key,
+        get_upsert_action(table, fields, key)
+    )
+    cursor_on_map.execute(sql)
+    loader.changed = cursor_on_map.rowcount
+    loader.key = key
+    loader.keys = fetch_keys(cursor_on_map)
+    cursor_on_map.execute("DROP TABLE {0}".format(delta))
+    loader.seconds += time.monotonic() - start
+    loader.table = table
+    return loader
+
+
+def get_hash_table(table):
+    return "{0}__hash".format(table)
+
+
+def load_diff(connection_on_map, table, fields, key, batches):
+    """
+        # Compara el hash de cada fila de origen con el guardado en la tabla <table>__hash
+        # y solo inserta, actualiza o elimina en la tabla espejo las filas que cambiaron
+    """
+    cursor_on_map = connection_on_map.cursor()
+    hash_table = get_hash_table(table)
+    cursor_on_map.execute("CREATE UNIQUE INDEX IF NOT EXISTS {0}_{1}_key ON {0} ({1})".format(table, key))
+    cursor_on_map.execute(
+        "CREATE TABLE IF NOT EXISTS {0} (key text PRIMARY KEY, row_hash char(32) NOT NULL)".format(hash_table)
+    )
+    delta = "{0}__delta".format(table)
+    cursor_on_map.execute("CREATE TEMP TABLE {0} (LIKE {1} INCLUDING DEFAULTS)".format(delta, table))
+    cursor_on_map.execute("ALTER TABLE {0} ADD COLUMN row_hash char(32)".format(delta))
+    loader = HashCopyLoader(connection_on_map, delta, fields)
+    loader.load(batches)
+
+    start = time.monotonic()
+    changed = "{0}__changed".format(table)
+    cursor_on_map.execute("CREATE INDEX ON {0} ({1})".format(delta, key))
+    cursor_on_map.execute("ANALYZE {0}".format(delta))
+    cursor_on_map.execute(
+        "CREATE TEMP TABLE {0} AS SELECT d.* FROM {1} d LEFT JOIN {2} h ON h.key = d.{3}::text "
+        "WHERE h.row_hash IS DISTINCT FROM d.row_hash".format(changed, delta, hash_table, key)
+    )
+    cursor_on_map.execute("INSERT INTO {0} ({1}) SELECT {1} FROM {2} ON CONFLICT ({3}) DO {4} RETURNING {3}::text".format(
+        table,
+        ", ".join(map(str, fields)),
+        changed,
+        key,
+        get_upsert_action(table, fields, key)
+    ))
+    loader.changed = cursor_on_map.rowcount
+    keys = fetch_keys(cursor_on_map)
+    cursor_on_map.execute(
+        "INSERT INTO {0} (key, row_hash) SELECT {1}::text, row_hash FROM {2} "
+        "ON CONFLICT (key) DO UPDATE SET row_hash = EXCLUDED.row_hash".format(hash_table, key, changed)
+    )
+    cursor_on_map.execute(
+        "DELETE FROM {0} m WHERE NOT EXISTS (SELECT 1 FROM {1} d WHERE d.{2} = m.{2}) "
+        "RETURNING m.{2}::text".format(table, delta, key)
+    )
+    loader.deleted = cursor_on_map.rowcount
+    deleted = fetch_keys(cursor_on_map)
+    loader.key = key
+    loader.keys = keys + deleted if keys is not None and deleted is not None else None
+    cursor_on_map.execute(
+        "DELETE FROM {0} h WHERE NOT EXISTS (SELECT 1 FROM {1} d WHERE d.{2}::text = h.key)".format(
+            hash_table, delta, key
+        )
+    )
+    cursor_on_map.execute("DROP TABLE {0}, {1}".format(delta, changed))
+    loader.seconds += time.monotonic() - start
+    loader.table = table
+    return loader
+
+
+def load_changelog(instance, connection, connection_on_map, table_origin, table, fields, key, keys):
+    """
+        # Vuelve a leer del origen solo las filas cuyas claves aparecen en el changelog: borra esas claves
+        # de la tabla espejo y carga las filas que siguen existiendo
+    """
+    cursor_on_map = connection_on_map.cursor()
+    key_type = create_key_index(cursor_on_map, table, key)
+    loader = get_loader(instance, connection_on_map, table, fields)
+    sql = "SELECT {0} FROM {1} WHERE {2} IN %s".format(", ".join(map(str, fields)), table_origin, key)
+    for start in range(0, len(keys), instance.batch_size):
+        chunk = keys[start:start + instance.batch_size]
+        cursor_on_map.execute("DELETE FROM {0} WHERE {1} = ANY(%s::{2}[])".format(table, key, key_type), (chunk,))
+        loader.load(stream_query(connection, sql, (chunk,), instance.batch_size))
+    loader.changed = loader.rows
+    loader.deleted = max(len(keys) - loader.rows, 0)
+    loader.key = key
+    loader.keys = keys if len(keys) <= settings.CHANGED_KEYS_LIMIT else None
+    return loader
+
+
+def get_staging_table(table):
+    return "{0}__staging".format(table)
+
+
+def create_staging(connection_on_map, table):
+    cursor_on_map = connection_on_map.cursor()
+    staging = get_staging_table(table)
+    cursor_on_map.execute("DROP TABLE IF EXISTS {0}".format(staging))
+    cursor_on_map.execute(
+        "CREATE UNLOGGED TABLE {0} (LIKE {1} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)".format(staging, table)
+    )
+    return staging
+
+
+def swap_staging(connection_on_map, table):
+    """
+        # Crea los índices de la tabla espejo sobre la tabla de staging ya cargada
+        # y la intercambia con la tabla espejo con ALTER TABLE ... RENAME en una transacción corta
+    """
+    cursor_on_map = connection_on_map.cursor()
+    staging = get_staging_table(table)
+    cursor_on_map.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", (table,))
+    indexes = cursor_on_map.fetchall()
+    for index_name, index_def in indexes:
+        cursor_on_map.execute(re.sub(
+            r"INDEX \S+ ON \S+", "INDEX {0}__s ON {1}".format(index_name, staging), index_def, count=1
+        ))
+    cursor_on_map.execute("ALTER TABLE {0} SET LOGGED".format(staging))
+    cursor_on_map.execute("ANALYZE {0}".format(staging))
+    connection_on_map.commit()
+
+    cursor_on_map.execute("SET LOCAL lock_timeout = '10s'")
+    # Read before the rename, the definitions of the views use the current name of the table
+    views = get_dependent_views(cursor_on_map, table)
+    cursor_on_map.execute("ALTER TABLE {0} RENAME TO {0}__old".format(table))
+    cursor_on_map.execute("ALTER TABLE {0} RENAME TO {1}".format(staging, table))
+    # The views still point to the old table, they are recreated on the new one in the same transaction
+    cursor_on_map.execute("DROP TABLE {0}__old CASCADE".format(table))
+    for index_name, index_def in indexes:
+        cursor_on_map.execute("ALTER INDEX {0}__s RENAME TO {0}".format(index_name))
+    failed = restore_views(cursor_on_map, views)
+    if failed:
+        raise ValueError("No se pudieron volver a crear las vistas de {0}: {1}".format(table, failed))
+    connection_on_map.commit()
+
+
+def load_swap(instance, connection_on_map, table, fields, batches):
+    """
+        # Carga las filas en una tabla UNLOGGED de staging y la intercambia con la tabla espejo
+    """
+    staging = create_staging(connection_on_map, table)
+    loader = get_loader(instance, connection_on_map, staging, fields)
+    loader.load(batches)
+    start = time.monotonic()
+    swap_staging(connection_on_map, table)
+    loader.seconds += time.monotonic() - start
+    loader.table = table
+    return loader
+
+
+def get_key_ranges(low, high, partitions):
+    step = max(math.ceil((high - low + 1) / partitions), 1)
+    return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+
+def load_range(instance, connection, staging, table_origin, fields, key, low, high):
+    connection_on_map = connect_with_on_map()
+    try:
+        sql = "SELECT {0} FROM {1} WHERE {2} >= %s AND {2} < %s".format(
+            ", ".join(map(str, fields)), table_origin, key
+        )
+        loader = get_loader(instance, connection_on_map, staging, fields)
+        loader.load(stream_query(connection, sql, (low, high), instance.batch_size))
+        connection_on_map.commit()
+        return loader
+    finally:
+        connection_on_map.close()
+
+
+def load_partitioned(instance, connection, connection_on_map, table_origin, table, fields, key, partitions):
+    """
+        # Divide la tabla de origen en hasta `partitions` rangos de la clave, los extrae y carga en paralelo
+        # sobre conexiones separadas en una tabla de staging y al terminar la intercambia con la tabla espejo.
+        # La conexión que ya tiene el worker carga el primer rango y las demás solo se abren si el servidor
+        # de origen tiene puestos libres, sin esperarlos
+    """
+    loader = Loader(connection_on_map, table, fields)
+    start = time.monotonic()
+    with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        cursor.execute("SELECT MIN({0}) AS low, MAX({0}) AS high FROM {1}".format(key, table_origin))
+        bounds = cursor.fetchone()
+    staging = create_staging(connection_on_map, table)
+    connection_on_map.commit()
+    if bounds["low"] is not None:
+        slots = try_acquire_source_slots(instance, partitions - 1)
+        connections = [connection]
+        try:
+            for slot in slots:
+                connections.append(connect_with_mysql(instance, pymysql.cursors.SSDictCursor, slot))
+            ranges = get_key_ranges(int(bounds["low"]), int(bounds["high"]), len(connections))
+            with ThreadPoolExecutor(max_workers=len(connections)) as executor:
+                futures = [
+                    executor.submit(load_range, instance, source, staging, table_origin, fields, key, low, high)
+                    for source, (low, high) in zip(connections, ranges)
+                ]
+                for future in futures:
+                    loader.merge(future.result())
+        finally:
+            for source in connections[1:]:
+                if source.open:
+                    source.close()
+            for slot in slots:
+                if slot is not None:
+                    slot.release()
+    swap_staging(connection_on_map, table)
+    loader.seconds = time.monotonic() - start
+    return loader
+
+
+def load_resumable(instance, connection, connection_on_map, table_origin, table, fields, key, last_key, on_batch):
+    """
+        # Carga la tabla de origen en orden de clave sobre la tabla de staging confirmando cada lote;
+        # on_batch(last_key, rows) guarda el avance para que un reintento continúe desde la última clave cargada
+    """
+    cursor_on_map = connection_on_map.cursor()
+    staging = get_staging_table(table)
+    cursor_on_map.execute("SELECT to_regclass(%s)", (staging,))
+    if last_key is None or cursor_on_map.fetchone()[0] is None:
+        last_key = None
+        create_staging(connection_on_map, table)
+    else:
+        # Rows past the checkpoint may belong to a batch whose checkpoint was never saved
+        cursor_on_map.execute("DELETE FROM {0} WHERE {1} > %s".format(staging, key), (last_key,))
+    connection_on_map.commit()
+
+    sql = "SELECT {0} FROM {1}".format(", ".join(map(str, fields)), table_origin)
+    params = None
+    if last_key is not None:
+        sql += " WHERE {0} > %s".format(key)
+        params = (last_key,)
+    sql += " ORDER BY {0}".format(key)
+    loader = get_loader(instance, connection_on_map, staging, fields)
+    for rows in loader.extract(stream_query(connection, sql, params, instance.batch_size)):
+        loader.load([rows])
+        connection_on_map.commit()
+        on_batch(str(rows[-1][key]), loader.rows)
+    start = time.monotonic()
+    swap_staging(connection_on_map, table)
+    loader.seconds += time.monotonic() - start
+    loader.table = table
+    return loader
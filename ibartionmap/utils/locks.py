@@ -0,0 +1,130 @@
+import threading
+import uuid
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+from ibartionmap.celery import BASE_REDIS_URL
+
+RUNNING = 'running'
+QUEUED = 'queued'
+IDLE = 'idle'
+
+# Compare and delete in a single step: the lock is only deleted by the token that holds it, and only
+# that caller takes the queued run
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return false
+end
+redis.call('DEL', KEYS[1])
+local queued = redis.call('GET', KEYS[2])
+redis.call('DEL', KEYS[2])
+return queued
+"""
+
+# Same check for the TTL: only the token that holds the lock extends it
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call('EXPIRE', KEYS[1], ARGV[2])
+"""
+
+
+def get_redis():
+    return redis.Redis.from_url(BASE_REDIS_URL, decode_responses=True)
+
+
+def get_lock_key(connection_id):
+    return "sync_with_connection:{0}:lock".format(connection_id)
+
+
+def get_queued_key(connection_id):
+    return "sync_with_connection:{0}:queued".format(connection_id)
+
+
+def acquire_sync_lock(connection_id):
+    """
+        # Toma el bloqueo de sincronización de la conexión, devuelve el token o None si ya hay una ejecución en curso
+        :param connection_id:
+        :return: str
+    """
+    token = str(uuid.uuid4())
+    if get_redis().set(get_lock_key(connection_id), token, nx=True, ex=settings.SYNC_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def queue_sync(connection_id, full=False):
+    """
+        # Deja a lo sumo una ejecución pendiente por conexión, una recarga completa prevalece sobre una normal
+    """
+    client = get_redis()
+    key = get_queued_key(connection_id)
+    if full:
+        client.set(key, "full", ex=settings.SYNC_LOCK_TIMEOUT)
+    else:
+        client.set(key, "sync", nx=True, ex=settings.SYNC_LOCK_TIMEOUT)
+
+
+def extend_sync_lock(connection_id, token):
+    """
+        # Renueva el tiempo de expiración del bloqueo si todavía es de este token
+        :param connection_id:
+        :param token:
+        :return: bool, False si el bloqueo expiró o es de otra ejecución
+    """
+    return bool(get_redis().eval(
+        EXTEND_SCRIPT, 1, get_lock_key(connection_id), token, settings.SYNC_LOCK_TIMEOUT
+    ))
+
+
+@contextmanager
+def keep_sync_lock(connection_id, token):
+    """
+        # Mantiene el bloqueo de la ejecución mientras dura el bloque, renovándolo en un hilo cada tercio
+        # de SYNC_LOCK_TIMEOUT; una tabla que tarda más que el timeout no deja que otra ejecución lo tome
+        :param connection_id:
+        :param token: None si la tarea no forma parte de una ejecución con bloqueo
+    """
+    if not token:
+        yield
+        return
+    stopped = threading.Event()
+
+    def extend():
+        while not stopped.wait(settings.SYNC_LOCK_TIMEOUT / 3):
+            try:
+                if not extend_sync_lock(connection_id, token):
+                    return
+            except redis.RedisError:
+                # A later attempt may still reach Redis before the lock expires
+                pass
+
+    thread = threading.Thread(target=extend, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def release_sync_lock(connection_id, token):
+    """
+        # Libera el bloqueo si todavía es de este token y devuelve la ejecución pendiente ("sync" o "full")
+        # o None. Si el bloqueo expiró y lo tomó otra ejecución, la pendiente queda para esa
+    """
+    return get_redis().eval(
+        RELEASE_SCRIPT, 2, get_lock_key(connection_id), get_queued_key(connection_id), token
+    )
+
+
+def get_sync_status(connection_id):
+    client = get_redis()
+    if client.exists(get_queued_key(connection_id)):
+        return QUEUED
+    if client.exists(get_lock_key(connection_id)):
+        return RUNNING
+    return IDLE
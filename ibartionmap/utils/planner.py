@@ -0,0 +1,204 @@
+import math
+
+from django_celery_beat.models import IntervalSchedule
+
+from ibartionmap.utils.functions import connect_with_mysql, get_name_table, get_table_options, get_table_key, \
+    is_integer_type
+
+PERIOD_SECONDS = {
+    IntervalSchedule.DAYS: 24 * 60 * 60,
+    IntervalSchedule.HOURS: 60 * 60,
+    IntervalSchedule.MINUTES: 60,
+    IntervalSchedule.SECONDS: 1,
+    IntervalSchedule.MICROSECONDS: 0.000001,
+}
+
+# Below this size a full reload is cheaper than keeping any change tracking
+SMALL_TABLE_ROWS = 100000
+# Above this size the table is split in key ranges extracted in parallel
+LARGE_TABLE_ROWS = 1000000
+# Column names that usually hold the last modification time
+WATERMARK_NAMES = ("updat", "modif", "changed")
+# Throughput assumed for a connection that was never synchronized
+DEFAULT_ROWS_PER_SECOND = 20000
+HISTORY_RUNS = 10
+MAX_PARTITIONS = 8
+# The recommended interval leaves room for a sync twice as long as estimated
+INTERVAL_MARGIN = 2
+
+
+def get_interval_seconds(every, period):
+    return every * PERIOD_SECONDS.get(period, 1)
+
+
+def get_table_sizes(instance):
+    """
+        # Filas estimadas y tamaño de cada tabla de la base de datos de origen según information_schema.TABLES
+        :param instance:
+        :return: dict
+    """
+    connection = connect_with_mysql(instance)
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH, AVG_ROW_LENGTH "
+                "FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s",
+                (instance.database_name,)
+            )
+            return {
+                row["TABLE_NAME"]: {
+                    "rows": int(row["TABLE_ROWS"] or 0),
+                    "data_length": int(row["DATA_LENGTH"] or 0),
+                    "index_length": int(row["INDEX_LENGTH"] or 0),
+                    "avg_row_length": int(row["AVG_ROW_LENGTH"] or 0),
+                }
+                for row in cursor.fetchall()
+            }
+
+
+def get_throughput(instance, table=None):
+    """
+        # Filas por segundo observadas en las últimas sincronizaciones de la tabla, o de toda la conexión
+        :param instance:
+        :param table:
+        :return: float
+    """
+    from apps.setting.models import SyncTableRun
+    runs = SyncTableRun.objects.filter(
+        sync_run__connection_id=instance.id, is_virtual=False, error__isnull=True, rows_read__gt=0
+    )
+    if table:
+        runs = runs.filter(table=table)
+    runs = runs.order_by('-started')[:HISTORY_RUNS]
+    rows = 0
+    seconds = 0
+    for run in runs:
+        rows += run.rows_read
+        seconds += run.extract_seconds + run.transform_seconds + run.load_seconds
+    return rows / seconds if seconds else None
+
+
+def get_changed_rows_per_run(instance, table, strategy):
+    """
+        # Filas leídas de media por las últimas ejecuciones de la tabla con una estrategia de cambios
+    """
+    from apps.setting.models import SyncTableRun
+    rows = list(SyncTableRun.objects.filter(
+        sync_run__connection_id=instance.id, table=table, strategy=strategy, error__isnull=True
+    ).order_by('-started').values_list('rows_read', flat=True)[:HISTORY_RUNS])
+    return sum(rows) / len(rows) if rows else None
+
+
+def get_watermark_candidate(fields_table):
+    for field in fields_table:
+        type_field = field.get("Type", "").lower()
+        if (type_field.startswith("timestamp") or type_field.startswith("datetime")) and \
+                any(name in field["Field"].lower() for name in WATERMARK_NAMES):
+            return field["Field"]
+    return None
+
+
+def recommend_strategy(options, fields_table, rows):
+    """
+        # Estrategia recomendada para la tabla según su tamaño, su clave y si tiene una columna de modificación
+        :return: dict
+    """
+    from apps.setting.models import Connection
+    key = get_table_key(options, fields_table)
+    types = {field["Field"]: field.get("Type", "") for field in fields_table}
+    watermark = options.get("watermark") or get_watermark_candidate(fields_table)
+    if rows < SMALL_TABLE_ROWS:
+        return {"strategy": Connection.FULL}
+    if key and watermark:
+        return {"strategy": Connection.INCREMENTAL, "key": key, "watermark": watermark}
+    if key and is_integer_type(types.get(key, "")) and rows >= LARGE_TABLE_ROWS:
+        return {
+            "strategy": Connection.FULL,
+            "key": key,
+            "partitions": min(MAX_PARTITIONS, math.ceil(rows / LARGE_TABLE_ROWS) + 1)
+        }
+    if key:
+        return {"strategy": Connection.HASH, "key": key}
+    return {"strategy": Connection.FULL}
+
+
+def plan_connection(instance, tables_selected=None):
+    """
+        # Estima sin sincronizar el tiempo de extracción y el tamaño de cada tabla seleccionada a partir de
+        # information_schema.TABLES y del rendimiento histórico, recomienda una estrategia por tabla
+        # y un every_interval que deje margen a la sincronización completa
+        :param instance:
+        :param tables_selected: selección a evaluar, por defecto info_to_sync_selected
+        :return: dict
+    """
+    from apps.setting.models import Connection
+    sizes = get_table_sizes(instance)
+    default_throughput = get_throughput(instance) or DEFAULT_ROWS_PER_SECOND
+    fields_tables = {info.get('table'): info.get('fields') or [] for info in instance.info_to_sync}
+    tables = []
+    throttled_seconds = 0
+    for table_selected in tables_selected if tables_selected is not None else instance.info_to_sync_selected:
+        options = get_table_options(table_selected)
+        table_origin = options["table"]
+        size = sizes.get(table_origin)
+        if size is None:
+            tables.append({"table": table_origin, "error": "La tabla no existe en la base de datos de origen"})
+            continue
+        table_name = get_name_table(instance, table_origin)
+        throughput = get_throughput(instance, table_name) or default_throughput
+        rows = size["rows"]
+        strategy = options.get("strategy", Connection.FULL)
+        rows_per_run = rows
+        if strategy != Connection.FULL:
+            changed_rows = get_changed_rows_per_run(instance, table_name, strategy)
+            if changed_rows is not None:
+                rows_per_run = changed_rows
+        fields_table = fields_tables.get(table_origin, [])
+        key = get_table_key(options, fields_table)
+        types = {field["Field"]: field.get("Type", "") for field in fields_table}
+        # Only integer keys are split in ranges, the rest is loaded in a single stream
+        partitions = int(options.get("partitions") or 1) if key and is_integer_type(types.get(key, "")) else 1
+        seconds = rows_per_run / throughput / partitions
+        # The throttle of the connection puts a floor on the extraction time
+        throttle_seconds = 0
+        if instance.max_rows_per_second:
+            throttle_seconds = rows_per_run / instance.max_rows_per_second
+        if instance.max_bytes_per_second:
+            throttle_seconds = max(
+                throttle_seconds, rows_per_run * size["avg_row_length"] / instance.max_bytes_per_second
+            )
+        throttled_seconds += throttle_seconds
+        seconds = max(seconds, throttle_seconds)
+        tables.append({
+            "table": table_origin,
+            "rows": rows,
+            "data_length": size["data_length"],
+            "index_length": size["index_length"],
+            "rows_per_second": round(throughput, 2),
+            "rows_per_run": int(rows_per_run),
+            "estimated_seconds": round(seconds, 3),
+            "estimated_mirror_bytes": rows * size["avg_row_length"],
+            "strategy": strategy,
+            "recommended": recommend_strategy(options, fields_tables.get(table_origin, []), rows)
+        })
+
+    estimated = [table["estimated_seconds"] for table in tables if "estimated_seconds" in table]
+    # Tables run as parallel subtasks, the serial sum is the worst case when workers are busy
+    serial_seconds = sum(estimated)
+    # The throttle is shared by every table of the connection, in parallel they still extract at its rate
+    parallel_seconds = max(max(estimated, default=0), throttled_seconds)
+    recommended_interval = max(
+        math.ceil(serial_seconds * INTERVAL_MARGIN), instance.min_interval
+    )
+    current_interval = get_interval_seconds(instance.every_interval, instance.period_interval)
+    result = {
+        "tables": tables,
+        "estimated_seconds": round(serial_seconds, 3),
+        "estimated_parallel_seconds": round(parallel_seconds, 3),
+        "estimated_mirror_bytes": sum(table.get("estimated_mirror_bytes", 0) for table in tables),
+        "every_interval": current_interval,
+        "recommended_every_interval": recommended_interval,
+    }
+    if current_interval < serial_seconds:
+        result["warning"] = "El intervalo actual es menor que la duración estimada de la sincronización"
+    return result
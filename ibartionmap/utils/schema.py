@@ -0,0 +1,179 @@
+import hashlib
+import json
+
+from ibartionmap import settings
+from ibartionmap.utils.connectors import get_connector
+from ibartionmap.utils.functions import get_dependent_views, restore_views
+from ibartionmap.utils.typemap import get_pg_type, get_pg_column, is_not_null
+
+UNCHANGED = "unchanged"
+CREATED = "created"
+ALTERED = "altered"
+RECREATED = "recreated"
+
+FINGERPRINT_KEYS = ("Field", "Type", "Null", "Key", "Default", "Extra")
+
+# Short names of get_pg_type and the names format_type gives them in pg_catalog
+PG_TYPE_NAMES = (
+    ("varchar", "character varying"),
+    ("char", "character"),
+)
+
+
+def normalize_pg_type(type_pg):
+    if type_pg == "char":
+        return "character(1)"
+    for short, name in PG_TYPE_NAMES:
+        if type_pg == short or type_pg.startswith(short + "("):
+            return name + type_pg[len(short):]
+    return type_pg
+
+
+def get_source_tables(instance):
+    """
+        # Campos de todas las tablas de la base de datos de origen, sin un SHOW COLUMNS por tabla
+        :param instance:
+        :return: dict {tabla de origen: campos}
+    """
+    return get_connector(instance).get_source_tables()
+
+
+def get_fingerprint(fields):
+    """
+        # Huella de la definición de una tabla, cambia solo si cambian sus columnas
+        :param fields:
+        :return: str
+    """
+    definition = [[field.get(key) for key in FINGERPRINT_KEYS] for field in fields]
+    return hashlib.md5(json.dumps(definition, default=str).encode()).hexdigest()
+
+
+def get_mirror_columns(cursor, tables):
+    """
+        # Columnas actuales de las tablas espejo según pg_catalog, en una sola consulta
+        :param cursor:
+        :param tables:
+        :return: dict {tabla: {columna: (tipo, not null)}}, las tablas que no existen no aparecen
+    """
+    cursor.execute(
+        "SELECT t, a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull "
+        "FROM unnest(%s::text[]) AS t "
+        "JOIN pg_attribute a ON a.attrelid = to_regclass(t) "
+        "WHERE a.attnum > 0 AND NOT a.attisdropped",
+        (list(tables),)
+    )
+    result = {}
+    for table, column, type_pg, not_null in cursor.fetchall():
+        result.setdefault(table, {})[column] = (type_pg, not_null)
+    return result
+
+
+def get_using(name, type_pg):
+    # Values that can't be cast, like the empty strings of the old date columns, become NULL
+    if type_pg == "boolean":
+        return "NULLIF({0}::text, '') NOT IN ('0', 'f', 'false')".format(name)
+    return "NULLIF({0}::text, '')::{1}".format(name, type_pg)
+
+
+def diff_table(table, columns, fields, native=False):
+    """
+        # Sentencias ALTER TABLE que llevan la tabla espejo a los campos de la tabla de origen
+        :param table:
+        :param columns: columnas actuales de la tabla espejo
+        :param fields: campos de SHOW COLUMNS de la tabla de origen
+        :param native: si los tipos de los campos son de un origen PostgreSQL
+        :return: list
+    """
+    statements = []
+    names = set()
+    for field in fields:
+        name = field["Field"]
+        # Unquoted identifiers are stored lowercase
+        names.add(name.lower())
+        type_pg = get_pg_type(field["Type"], native)
+        not_null = is_not_null(field, native)
+        current = columns.get(name.lower())
+        if current is None:
+            # The column is added nullable, NOT NULL is set by a later reconciliation once it is loaded
+            statements.append("ALTER TABLE {0} ADD COLUMN {1} {2}".format(table, name, type_pg))
+            continue
+        current_type, current_not_null = current
+        if current_type != normalize_pg_type(type_pg):
+            statements.append("ALTER TABLE {0} ALTER COLUMN {1} TYPE {2} USING {3}".format(
+                table, name, type_pg, get_using(name, type_pg)
+            ))
+        if not_null and not current_not_null:
+            statements.append("ALTER TABLE {0} ALTER COLUMN {1} SET NOT NULL".format(table, name))
+        elif current_not_null and not not_null:
+            statements.append("ALTER TABLE {0} ALTER COLUMN {1} DROP NOT NULL".format(table, name))
+    for name in columns:
+        if name not in names:
+            statements.append("ALTER TABLE {0} DROP COLUMN {1}".format(table, name))
+    return statements
+
+
+def create_table(cursor, table, fields, native=False):
+    views = get_dependent_views(cursor, table)
+    cursor.execute("DROP TABLE IF EXISTS {0}, {0}__hash CASCADE".format(table))
+    cursor.execute("CREATE TABLE {0} ({1})".format(
+        table, ", ".join(get_pg_column(field["Field"], field, native) for field in fields)
+    ))
+    # The views that still match the new columns are back before the commit
+    return restore_views(cursor, views)
+
+
+def reconcile_tables(connection_on_map, tables, batch_size=None, on_progress=None, native=False):
+    """
+        # Aplica sobre las tablas espejo solo los cambios de esquema de sus tablas de origen. Las tablas
+        # sin cambios no se tocan, las que cambian se alteran con ALTER TABLE ADD/DROP/ALTER COLUMN y
+        # conservan sus datos, y solo se vuelven a crear si un ALTER falla. El DDL de batch_size tablas
+        # se confirma en una sola transacción
+        :param connection_on_map:
+        :param tables: {tabla espejo: campos de la tabla de origen}
+        :param batch_size: tablas por transacción, por defecto SCHEMA_BATCH_SIZE
+        :param on_progress: función que recibe el resultado parcial después de cada transacción
+        :param native: si los tipos de los campos son de un origen PostgreSQL
+        :return: dict {tabla espejo: {"action", "sql", "error"}}
+    """
+    batch_size = batch_size or settings.SCHEMA_BATCH_SIZE
+    cursor = connection_on_map.cursor()
+    mirrors = get_mirror_columns(cursor, tables.keys())
+    result = {}
+    pending = 0
+    for table, fields in tables.items():
+        columns = mirrors.get(table)
+        if columns is None:
+            create_table(cursor, table, fields, native)
+            result[table] = {"action": CREATED}
+        else:
+            statements = diff_table(table, columns, fields, native)
+            if not statements:
+                result[table] = {"action": UNCHANGED}
+                continue
+            # A failed ALTER only undoes the statements of its own table
+            cursor.execute("SAVEPOINT reconcile_table")
+            try:
+                for sql in statements:
+                    cursor.execute(sql)
+                # The stored hashes don't match the new columns
+                cursor.execute("DROP TABLE IF EXISTS {0}__hash".format(table))
+                cursor.execute("RELEASE SAVEPOINT reconcile_table")
+                result[table] = {"action": ALTERED, "sql": statements}
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT reconcile_table")
+                result[table] = {"action": RECREATED, "sql": statements, "error": e.__str__()}
+                views = create_table(cursor, table, fields, native)
+                if views:
+                    # Views that used a column that is gone are rebuilt with their virtual tables
+                    result[table]["views"] = views
+        pending += 1
+        if pending >= batch_size:
+            connection_on_map.commit()
+            pending = 0
+            if on_progress:
+                on_progress(result)
+    if pending:
+        connection_on_map.commit()
+    if on_progress:
+        on_progress(result)
+    return result
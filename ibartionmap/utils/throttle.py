@@ -0,0 +1,134 @@
+import time
+import uuid
+
+from django.conf import settings
+
+from ibartionmap.utils.locks import get_redis
+
+
+# Reserves `cost` seconds of the budget shared by every session of the connection and returns how
+# long the caller waits for its turn. The key keeps the time at which the budget is free again, which
+# lags behind now by at most a second, so a slow reader isn't slowed down further by the throttle
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local ready = tonumber(redis.call('GET', KEYS[1]) or '0')
+if ready < now - 1 then
+    ready = now - 1
+end
+ready = ready + tonumber(ARGV[2])
+redis.call('SET', KEYS[1], tostring(ready), 'PX', math.max(math.ceil((ready - now) * 1000), 0) + 1000)
+return tostring(math.max(ready - now, 0))
+"""
+
+
+class Throttle:
+    """
+        # Limita el ritmo de extracción de una conexión de origen a filas/bytes por segundo
+        # y agrega una pausa opcional entre lotes. El presupuesto se comparte en Redis entre todas
+        # las sesiones de la conexión, tablas y particiones en paralelo extraen juntas al límite
+    """
+
+    def __init__(self, key, rows_per_second=0, bytes_per_second=0, pause=0):
+        self.key = key
+        self.rows_per_second = rows_per_second
+        self.bytes_per_second = bytes_per_second
+        self.pause = pause
+        self.client = None
+
+    def reserve(self, name, cost):
+        if self.client is None:
+            self.client = get_redis()
+        return float(self.client.eval(RESERVE_SCRIPT, 1, "{0}:{1}".format(self.key, name), time.time(), cost))
+
+    def wait(self, rows):
+        delay = 0
+        if self.rows_per_second:
+            delay = max(delay, self.reserve("rows", len(rows) / self.rows_per_second))
+        if self.bytes_per_second:
+            size = sum(len(str(value)) for row in rows for value in row.values() if value is not None)
+            delay = max(delay, self.reserve("bytes", size / self.bytes_per_second))
+        delay += self.pause / 1000
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SourceSlotUnavailable(TimeoutError):
+    pass
+
+
+class SourceSlot:
+    """
+        # Semáforo en Redis que limita las conexiones simultáneas a un mismo servidor de origen
+        # entre todos los workers; los puestos no liberados expiran tras SYNC_LOCK_TIMEOUT
+    """
+
+    def __init__(self, host, port, limit):
+        self.key = "source_connections:{0}:{1}".format(host, port)
+        self.limit = limit
+        self.token = str(uuid.uuid4())
+        self.acquired = False
+
+    def try_acquire(self):
+        client = get_redis()
+        now = time.time()
+        pipeline = client.pipeline()
+        pipeline.zremrangebyscore(self.key, 0, now - settings.SYNC_LOCK_TIMEOUT)
+        pipeline.zadd(self.key, {self.token: now})
+        pipeline.zrank(self.key, self.token)
+        rank = pipeline.execute()[-1]
+        if rank is not None and rank < self.limit:
+            client.expire(self.key, settings.SYNC_LOCK_TIMEOUT)
+            return True
+        client.zrem(self.key, self.token)
+        return False
+
+    def acquire(self, wait=True):
+        deadline = time.monotonic() + (settings.SYNC_LOCK_TIMEOUT if wait else 0)
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                raise SourceSlotUnavailable("No source connection slot available for {0}".format(self.key))
+            time.sleep(1)
+        self.acquired = True
+
+    def release(self):
+        if self.acquired:
+            self.acquired = False
+            get_redis().zrem(self.key, self.token)
+
+
+def get_throttle(instance):
+    return Throttle(
+        "source_throttle:{0}".format(instance.id),
+        instance.max_rows_per_second, instance.max_bytes_per_second, instance.batch_pause
+    )
+
+
+def try_acquire_source_slots(instance, count):
+    """
+        # Toma sin esperar hasta `count` puestos de conexión libres del servidor de origen
+        :param instance:
+        :param count:
+        :return: list, con None por puesto si la conexión no limita las conexiones simultáneas
+    """
+    if not instance.max_source_connections:
+        return [None] * count
+    slots = []
+    for i in range(min(count, instance.max_source_connections)):
+        slot = SourceSlot(instance.host, instance.database_port, instance.max_source_connections)
+        if not slot.try_acquire():
+            break
+        slot.acquired = True
+        slots.append(slot)
+    return slots
+
+
+def acquire_source_slot(instance, wait=True):
+    """
+        # Toma un puesto de conexión del servidor de origen, o None si la conexión no los limita. Sin wait
+        # lanza SourceSlotUnavailable en lugar de esperar a que se libere uno
+    """
+    if not instance.max_source_connections:
+        return None
+    slot = SourceSlot(instance.host, instance.database_port, instance.max_source_connections)
+    slot.acquire(wait)
+    return slot
@@ -0,0 +1,240 @@
+import datetime
+import json
+import re
+
+from pymysql.constants import FIELD_TYPE
+
+TYPE_PATTERN = re.compile(r"^\s*(\w+)\s*(?:\(([^)]*)\))?\s*(.*)$")
+
+BOOLEAN_TYPES = ("bool", "boolean")
+TEMPORAL_TYPES = ("date", "datetime", "timestamp")
+TEXT_TYPES = ("tinytext", "text", "mediumtext", "longtext", "enum", "set")
+BINARY_TYPES = ("binary", "varbinary", "tinyblob", "blob", "mediumblob", "longblob")
+
+INTEGER_TYPES = {
+    # MySQL type: (signed, unsigned)
+    "tinyint": ("smallint", "smallint"),
+    "smallint": ("smallint", "integer"),
+    "mediumint": ("integer", "integer"),
+    "int": ("integer", "bigint"),
+    "integer": ("integer", "bigint"),
+    "bigint": ("bigint", "numeric(20,0)"),
+}
+
+# Types of a pymysql cursor description that may need a converter. Text columns share the codes
+# of binary ones, but only bytes values are converted
+DESCRIPTION_TYPES = {
+    FIELD_TYPE.BIT: "bit",
+    FIELD_TYPE.TINY: "tinyint",
+    FIELD_TYPE.DATE: "date",
+    FIELD_TYPE.NEWDATE: "date",
+    FIELD_TYPE.DATETIME: "datetime",
+    FIELD_TYPE.TIMESTAMP: "timestamp",
+    FIELD_TYPE.TIME: "time",
+    FIELD_TYPE.JSON: "json",
+    FIELD_TYPE.TINY_BLOB: "blob",
+    FIELD_TYPE.MEDIUM_BLOB: "blob",
+    FIELD_TYPE.LONG_BLOB: "blob",
+    FIELD_TYPE.BLOB: "blob",
+    FIELD_TYPE.VAR_STRING: "varbinary",
+    FIELD_TYPE.STRING: "binary",
+}
+
+
+def parse_type(type_field):
+    """
+        # Separa un tipo de MySQL como "decimal(10,2) unsigned" en nombre, argumentos y si es unsigned
+        :param type_field:
+        :return: tuple
+    """
+    match = TYPE_PATTERN.match(type_field or "")
+    if not match:
+        return "", [], False
+    name, args, extra = match.groups()
+    args = [arg.strip() for arg in args.split(",")] if args else []
+    return name.lower(), args, "unsigned" in extra.lower()
+
+
+def is_boolean_type(name, args):
+    return name in BOOLEAN_TYPES or (name in ("tinyint", "bit") and args == ["1"])
+
+
+def get_pg_type(type_field, native=False):
+    """
+        # Tipo nativo de PostgreSQL equivalente a un tipo de columna de MySQL
+        :param type_field:
+        :param native: si el tipo viene de un origen PostgreSQL, que se conserva tal cual
+        :return: str
+    """
+    if native:
+        return type_field
+    name, args, unsigned = parse_type(type_field)
+    if is_boolean_type(name, args):
+        return "boolean"
+    if name in INTEGER_TYPES:
+        return INTEGER_TYPES[name][1 if unsigned else 0]
+    if name in ("decimal", "numeric", "dec", "fixed"):
+        precision = args[0] if args else "10"
+        scale = args[1] if len(args) > 1 else "0"
+        return "numeric({0},{1})".format(precision, scale)
+    if name == "float":
+        return "real"
+    if name in ("double", "real"):
+        return "double precision"
+    if name == "bit":
+        return "bit({0})".format(args[0] if args else 1)
+    if name == "date":
+        return "date"
+    if name in ("datetime", "timestamp"):
+        return "timestamp({0}) without time zone".format(args[0]) if args else "timestamp without time zone"
+    if name == "time":
+        # MySQL times go from -838:59:59 to 838:59:59
+        return "interval"
+    if name == "year":
+        return "smallint"
+    if name in ("char", "varchar"):
+        return "{0}({1})".format(name, args[0]) if args else name
+    if name in TEXT_TYPES:
+        return "text"
+    if name == "json":
+        return "jsonb"
+    if name in BINARY_TYPES:
+        return "bytea"
+    return "text"
+
+
+def is_not_null(field, native=False):
+    # Zero dates of MySQL (0000-00-00) are loaded as NULL, so its dates always allow it
+    type_name, args, unsigned = parse_type(field.get("Type"))
+    return field.get("Null") == "NO" and (native or type_name not in TEMPORAL_TYPES)
+
+
+def get_pg_column(name, field, native=False):
+    """
+        # Definición de la columna de la tabla espejo. Las fechas de MySQL admiten NULL siempre porque
+        # las fechas cero (0000-00-00) se guardan como NULL
+        :param name:
+        :param field:
+        :param native: si el campo viene de un origen PostgreSQL
+        :return: str
+    """
+    return "{0} {1}{2}".format(
+        name, get_pg_type(field.get("Type"), native), " NOT NULL" if is_not_null(field, native) else ""
+    )
+
+
+def to_boolean(value):
+    if isinstance(value, bytes):
+        return int.from_bytes(value, "big") != 0
+    if isinstance(value, str):
+        return value not in ("", "0")
+    return bool(value)
+
+
+def to_temporal(value):
+    # Zero dates are not valid in PostgreSQL
+    if isinstance(value, str) and value.startswith("0000-00-00"):
+        return None
+    return value
+
+
+def to_interval(value):
+    if isinstance(value, datetime.timedelta):
+        return "{0} seconds".format(value.total_seconds())
+    return value
+
+
+def to_bytea(value):
+    if isinstance(value, (bytes, bytearray)):
+        return "\\x" + value.hex()
+    return value
+
+
+def to_json(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def get_bit_converter(length):
+    def to_bit(value):
+        if isinstance(value, (bytes, bytearray)):
+            return format(int.from_bytes(value, "big"), "0{0}b".format(length))
+        if isinstance(value, int):
+            return format(value, "0{0}b".format(length))
+        return value
+    return to_bit
+
+
+def get_converter(type_field):
+    """
+        # Función que convierte un valor leído de MySQL al formato que espera el tipo de PostgreSQL,
+        # o None si el valor se carga tal cual
+        :param type_field:
+        :return: function
+    """
+    name, args, unsigned = parse_type(type_field)
+    if is_boolean_type(name, args):
+        return to_boolean
+    if name == "bit":
+        return get_bit_converter(int(args[0]) if args else 1)
+    if name in TEMPORAL_TYPES:
+        return to_temporal
+    if name == "time":
+        return to_interval
+    if name == "json":
+        return to_json
+    if name in BINARY_TYPES:
+        return to_bytea
+    return None
+
+
+def get_converters(types):
+    """
+        # Conversores por columna para {columna: tipo de MySQL}
+        :param types:
+        :return: dict
+    """
+    converters = {}
+    for name, type_field in types.items():
+        converter = get_converter(type_field)
+        if converter is not None:
+            converters[name] = converter
+    return converters
+
+
+def get_description_type(column):
+    """
+        # Tipo de MySQL aproximado de una columna de cursor.description de pymysql
+        :param column:
+        :return: str
+    """
+    name, type_code, display_size, length = column[:4]
+    type_field = DESCRIPTION_TYPES.get(type_code)
+    if type_field in ("tinyint", "bit"):
+        return "{0}({1})".format(type_field, length)
+    return type_field
+
+
+def get_cursor_converters(cursor):
+    """
+        # Conversores por columna del resultado de un cursor de pymysql
+        :param cursor:
+        :return: dict
+    """
+    return get_converters({
+        column[0]: get_description_type(column) for column in cursor.description or []
+        if get_description_type(column)
+    })
+
+
+def convert_rows(rows, converters):
+    if converters:
+        for row in rows:
+            for name, converter in converters.items():
+                value = row.get(name)
+                if value is not None:
+                    row[name] = converter(value)
+    return rows